@@ -0,0 +1,267 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pade
+import sampling
+from parking_simulator import ParkingSimulator
+
+# Problem sizes of the pade benchmark.
+PADE_SAMPLES = (1000, 10000, 100000)
+PADE_DIMENSIONS = (2, 3, 4)
+
+# Features of the synthetic pade data, the first d are used.
+PADE_FEATURES = ['theta', 'gamma', 'alpha', 'v']
+
+
+# Create a console simulator with the car driving forward in a circle.
+def _driving_simulator(use_dqn_image=False):
+    parking = ParkingSimulator(
+        initial_state=(640, 300, 0),
+        goal_state=(640, 300, 0),
+        goal_tolerance=(10, 10, 5),
+        visualize=False,
+        fps=50,
+        window_size=(1280, 720),
+        use_dqn_image=use_dqn_image
+    )
+    parking.execute_action((1, 1))
+    return parking
+
+
+# Steps per second of ParkingSimulator.run with the per-frame render and input hooks.
+def bench_run_steps(frames=100000):
+    parking = _driving_simulator()
+    start = time.perf_counter()
+    for _ in range(frames):
+        ParkingSimulator._process_input(parking)
+        ParkingSimulator._render_dqn_image(parking)
+        ParkingSimulator.render_frame(parking)
+        parking._car.turn_wheel(parking._input_steering, parking._dt)
+        parking._car.move(parking._input_direction, parking._dt)
+    return frames / (time.perf_counter() - start)
+
+
+# Steps per second of the headless physics loop.
+def bench_headless_steps(frames=100000):
+    parking = _driving_simulator()
+    start = time.perf_counter()
+    parking.run_headless(frames)
+    return frames / (time.perf_counter() - start)
+
+
+# Frames per second of ParkingSimulator.run rendering the DQN image of every frame.
+def bench_dqn_frames(frames=10000):
+    parking = _driving_simulator(use_dqn_image=True)
+    start = time.perf_counter()
+    parking.run(frames)
+    return frames / (time.perf_counter() - start)
+
+
+# Seconds (best of repeat runs) to start the command-line entry point and print its help.
+def bench_cli_startup(repeat=5):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py'), '--help']
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds
+
+
+# Synthetic car samples: uniform random controls with a fixed seed, driven for 50
+# frames as in induction.py, with the first d PADE_FEATURES as data and dx as target.
+def synthetic_samples(n, d, seed=0):
+    samples = sampling.collect_samples(
+        sampling.UniformControls(n, v=(10, 90)), frames=50, fps=50, seed=seed, closed_form=True)
+    columns = [sampling.COLUMNS.index(name) for name in PADE_FEATURES[:d]]
+    return samples[:, columns], samples[:, sampling.COLUMNS.index('dx')]
+
+
+# Peak resident memory of this process in MB. On Linux this is VmHWM, as
+# ru_maxrss also keeps the peak of the process this one was started from.
+def _peak_rss():
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2 ** 10
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+# Peak resident memory in MB that function(*args) adds to the process, so that
+# it includes memory not allocated by NumPy such as the nodes of cKDTree. The
+# peak never goes down, so this must run in a fresh process.
+def _added_peak_rss(function, args):
+    before = _peak_rss()
+    function(*args)
+    return _peak_rss() - before
+
+
+# Result, wall time in seconds (best of repeat runs) and peak resident memory in
+# MB of function(*args), the memory measured in a separate process per call.
+def _measure(function, args, repeat=1):
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        peak = pool.submit(_added_peak_rss, function, args).result()
+    return result, seconds, peak
+
+
+# Wall time in seconds and peak resident memory in MB of pade.pade.
+def bench_pade(n, d, nNeighbours=10, repeat=1, seed=0):
+    (data, target) = synthetic_samples(n, d, seed)
+    (_, seconds, peak) = _measure(functools.partial(pade.pade, nNeighbours=nNeighbours), (data, target), repeat)
+    return seconds, peak
+
+
+# Models compared with the analytic derivative signs: the features and targets of
+# one pade run, and the feature whose derivative sign is checked for each target,
+# as in calc.py, calcY.py and calcTh.py.
+ACCURACY_MODELS = [
+    (['theta', 'gamma'], ['dx', 'dy'], 'gamma'),
+    (['theta', 'alpha'], ['dtheta'], 'alpha'),
+]
+
+
+# Agreement of the pade Q-tables with the analytic derivative signs, with wall time
+# and peak memory, for every sample count and nNeighbours. The states are simulated
+# at v = 50 as in induction.py, for a few frames only, so that the differences
+# approximate the derivatives.
+def bench_pade_accuracy(samples=(1000, 3000, 10000, 30000), neighbours=(5, 10, 20, 50), frames=5, seed=0, log=print):
+    import kinematics
+    model = kinematics.KinematicModel()
+    rows = []
+    for n in samples:
+        data = sampling.collect_samples(sampling.UniformControls(n, v=(50, 50)), frames=frames, fps=50, seed=seed, closed_form=True)
+        columns = lambda names: data[:, [sampling.COLUMNS.index(name) for name in names]]
+        for k in neighbours:
+            row = {'n': n, 'nNeighbours': k, 'seconds': 0.0, 'peak_rss_mb': 0.0, 'agreement': {}}
+            for (features, targets, checked) in ACCURACY_MODELS:
+                x = columns(features)
+                (q_tables, seconds, peak) = _measure(functools.partial(pade.pade, nNeighbours=k), (x, columns(targets)))
+                row['seconds'] += seconds
+                row['peak_rss_mb'] = max(row['peak_rss_mb'], peak)
+                dim = features.index(checked)
+                for (target, q_table) in zip(targets, q_tables):
+                    truth = model.q_table(columns(features + ['v']), features + ['v'], target)
+                    row['agreement'][target] = float(np.mean(q_table[:, dim] == truth[:, dim]))
+            row['min_agreement'] = min(row['agreement'].values())
+            rows.append(row)
+            log('n={:<6} k={:<3} {:8.3f} s {:7.1f} MB  agreement {}'.format(n, k, row['seconds'], row['peak_rss_mb'],
+                ' '.join('{}={:.3f}'.format(target, value) for (target, value) in row['agreement'].items())))
+    return rows
+
+
+# The fastest configuration of bench_pade_accuracy whose agreement reaches the target for every model.
+def cheapest_configuration(rows, target_accuracy=0.95):
+    good = [row for row in rows if row['min_agreement'] >= target_accuracy]
+    return min(good, key=lambda row: row['seconds']) if good else None
+
+
+# Run all benchmarks and return the results as a flat dict of metrics. Metrics
+# ending in _per_s are better when higher, all others when lower.
+def run_suite(samples=PADE_SAMPLES, dimensions=PADE_DIMENSIONS, frames=100000, log=print):
+    results = {}
+    results['run_steps_per_s'] = bench_run_steps(frames)
+    log('run with render hooks: {:.0f} steps/s'.format(results['run_steps_per_s']))
+    results['headless_steps_per_s'] = bench_headless_steps(frames)
+    log('run_headless:          {:.0f} steps/s'.format(results['headless_steps_per_s']))
+    results['dqn_frames_per_s'] = bench_dqn_frames(frames // 10)
+    log('run with DQN image:    {:.0f} frames/s'.format(results['dqn_frames_per_s']))
+    results['cli_startup_seconds'] = bench_cli_startup()
+    log('cli.py --help:         {:.3f} s'.format(results['cli_startup_seconds']))
+
+    for n in samples:
+        for d in dimensions:
+            (seconds, peak) = bench_pade(n, d, repeat=5 if n <= 10000 else 1)
+            results['pade_n{}_d{}_seconds'.format(n, d)] = seconds
+            results['pade_n{}_d{}_peak_rss_mb'.format(n, d)] = peak
+            log('pade n={:<6} d={}:    {:8.3f} s {:8.1f} MB'.format(n, d, seconds, peak))
+    return results
+
+
+def save_results(results, path):
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+# Compare results to a baseline; returns (metric, baseline, value, relative change)
+# for the metrics that got worse by more than the tolerance.
+def compare(results, baseline, tolerance=0.2):
+    regressions = []
+    for (metric, value) in results.items():
+        if metric not in baseline:
+            continue
+        reference = baseline[metric]
+        if metric.endswith('_per_s'):
+            change = reference / value - 1 if value > 0 else float('inf')
+        else:
+            change = value / reference - 1 if reference > 0 else 0.0
+        if change > tolerance:
+            regressions.append((metric, reference, value, change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the simulator and pade.')
+    parser.add_argument('--output', help='where to save the results (default: benchmark_results.json, '
+                        'or benchmark_accuracy.json with --accuracy)')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='also save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative slowdown reported as a regression')
+    parser.add_argument('--quick', action='store_true', help='skip the largest pade problems')
+    parser.add_argument('--accuracy', type=float, metavar='TARGET',
+                        help='instead, compare pade with the analytic signs and find the cheapest configuration reaching TARGET')
+    args = parser.parse_args()
+
+    if args.accuracy is not None:
+        rows = bench_pade_accuracy()
+        with open(args.output or 'benchmark_accuracy.json', 'w') as f:
+            json.dump({'target_accuracy': args.accuracy, 'curve': rows}, f, indent=2)
+        best = cheapest_configuration(rows, args.accuracy)
+        if best is None:
+            print('No configuration reaches an agreement of {}.'.format(args.accuracy))
+        else:
+            print('Cheapest configuration: n={} nNeighbours={} ({:.3f} s, agreement {:.3f}).'.format(
+                best['n'], best['nNeighbours'], best['seconds'], best['min_agreement']))
+        raise SystemExit(0)
+
+    results = run_suite(samples=PADE_SAMPLES[:-1] if args.quick else PADE_SAMPLES,
+                        frames=10000 if args.quick else 100000)
+    save_results(results, args.output or 'benchmark_results.json')
+    if args.save_baseline:
+        save_results(results, args.baseline)
+    elif os.path.exists(args.baseline):
+        regressions = compare(results, load_results(args.baseline), args.tolerance)
+        for (metric, reference, value, change) in regressions:
+            print('REGRESSION {}: {:.4g} -> {:.4g} ({:+.0%})'.format(metric, reference, value, change))
+        if regressions:
+            raise SystemExit(1)
+        print('No regressions against {}.'.format(args.baseline))
+    else:
+        print('No baseline at {}, run with --save-baseline to store one.'.format(args.baseline))
@@ -1,28 +1,23 @@
-import numpy as np
-import matplotlib.pyplot as plt
-from sklearn import tree
 from sklearn.tree import export_text
-import pade
-#from explore_car1 import data
+import pipeline
 
-# Load data from CSV
-data = np.loadtxt('car_samples.csv', delimiter=',')
-#print(data)
-target = data[:, 4]
-#print(target)
-#theta = data[:, 4]
-data = data[:, :4]
-print(data)
+# Samples -> PADE -> Q-labels -> decision tree, every stage cached in .pipeline_cache
+qualitative = pipeline.QualitativePipeline(
+    features=['theta', 'x', 'dx', 'gamma'],
+    target='v',
+    label_attributes=['gamma'],
+    tree_features=['theta', 'x', 'dx'],
+    dataset_path='car_samples.npds',
+    csv_path='car_samples.csv',
+    nNeighbours=10,
+    min_impurity_decrease=0.02
+)
 
 # Train the qualitative model using PADE
-q_table = pade.pade(data, target, nNeighbours=10)
+q_table = qualitative.q_table()
 print(q_table)
-q_labels = pade.create_q_labels(q_table[:, 3:4], ['gamma'])
 
-classes, class_names = pade.enumerate_q_labels(q_labels)
-
-classifier = tree.DecisionTreeClassifier(min_impurity_decrease=0.02)
-model = classifier.fit(data[:, :3], classes)
+model = qualitative.model()
 
 # Display feature importance
 importance = model.feature_importances_
@@ -30,5 +25,4 @@ print("Feature importances:", importance)
 
 tree_rules = export_text(model, feature_names=['theta', 'x', 'dx'])
 
-tree.plot_tree(model, feature_names=['theta', 'x', 'dx'], class_names=class_names, filled=True)
-plt.show()
\ No newline at end of file
+qualitative.plot()
\ No newline at end of file
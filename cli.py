@@ -0,0 +1,143 @@
+import argparse
+import sys
+
+# Command-line entry point of the modelling chain:
+#   python cli.py collect  simulate samples into a dataset
+#   python cli.py pade     compute a Q-table from a dataset
+#   python cli.py tree     learn the qualitative decision tree and print its rules
+#   python cli.py plot     plot the decision tree
+# Only argparse is imported at startup. numpy, scipy, sklearn and matplotlib are
+# imported by the subcommands that need them, so --help and the headless
+# subcommands never pay for the plotting stack.
+
+DEFAULT_DATASET = 'car_samples.npds'
+
+
+def collect(args):
+    import dataset
+    import sampling
+    controls = sampling.UniformControls(args.samples, theta=args.theta, alpha=args.alpha, v=args.v)
+    data = sampling.collect_samples(controls, frames=args.frames, fps=args.fps, n_jobs=args.jobs,
+                                    seed=args.seed, closed_form=args.closed_form)
+    metadata = {'samples': args.samples, 'theta': args.theta, 'alpha': args.alpha, 'v': args.v,
+                'frames': args.frames, 'fps': args.fps, 'seed': args.seed}
+    dataset.save_dataset(args.output, data, sampling.COLUMNS, metadata)
+    print('Saved {} samples with columns {} to {}'.format(len(data), ', '.join(sampling.COLUMNS), args.output))
+
+
+def _load_samples(args):
+    import dataset
+    if args.csv is not None:
+        return dataset.load_or_import(args.dataset, args.csv, args.columns or dataset.CAR_SAMPLES_COLUMNS)
+    return dataset.load_dataset(args.dataset)
+
+
+def run_pade(args):
+    import numpy as np
+    import pade
+    samples = _load_samples(args)
+    data = samples.select(args.features)
+    target = samples.select(args.target)
+    q_tables = pade.pade(data, target if len(args.target) > 1 else target[:, 0],
+                         nNeighbours=args.neighbours, n_jobs=args.jobs)
+    if len(args.target) == 1:
+        q_tables = [q_tables]
+
+    for (name, q_table) in zip(args.target, q_tables):
+        (classes, class_names) = pade.enumerate_q_table(q_table, args.features)
+        counts = np.bincount(classes, minlength=len(class_names))
+        print('{}:'.format(name))
+        for (label, count) in zip(class_names, counts):
+            print('  {:<40} {}'.format(label, count))
+    if args.output is not None:
+        np.save(args.output, np.stack(q_tables) if len(q_tables) > 1 else q_tables[0])
+        print('Saved the Q-table to {}'.format(args.output))
+
+
+def _pipeline(args):
+    import pipeline
+    return pipeline.QualitativePipeline(
+        features=args.features,
+        target=args.target,
+        label_attributes=args.labels,
+        tree_features=args.tree_features,
+        dataset_path=args.dataset,
+        csv_path=args.csv,
+        columns=args.columns,
+        nNeighbours=args.neighbours,
+        min_impurity_decrease=args.min_impurity_decrease,
+        cache_dir=args.cache_dir
+    )
+
+
+def tree(args):
+    from sklearn.tree import export_text
+    qualitative = _pipeline(args)
+    model = qualitative.model()
+    print('Feature importances:', dict(zip(qualitative.tree_features, model.feature_importances_.round(3))))
+    print(export_text(model, feature_names=qualitative.tree_features))
+
+
+def plot(args):
+    _pipeline(args).plot()
+
+
+def _add_dataset_arguments(parser):
+    parser.add_argument('--dataset', default=DEFAULT_DATASET, help='dataset directory (default: %(default)s)')
+    parser.add_argument('--csv', help='CSV file to import the dataset from, e.g. car_samples.csv, '
+                        'again whenever the file changes')
+    parser.add_argument('--columns', nargs='+', help='column names of the CSV file')
+    parser.add_argument('--features', nargs='+', default=['theta', 'dx', 'gamma'], help='pade features')
+    parser.add_argument('--neighbours', type=int, default=10, help='pade nNeighbours (default: %(default)s)')
+
+
+def _add_tree_arguments(parser):
+    _add_dataset_arguments(parser)
+    parser.add_argument('--target', default='v', help='pade target (default: %(default)s)')
+    parser.add_argument('--labels', nargs='+', default=['gamma'], help='features of the Q-labels')
+    parser.add_argument('--tree-features', nargs='+', help='decision tree features (default: the pade features)')
+    parser.add_argument('--min-impurity-decrease', type=float, default=0.02)
+    parser.add_argument('--cache-dir', default='.pipeline_cache')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='Learn qualitative models of the car.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('collect', help='simulate samples into a dataset')
+    command.add_argument('output', help='dataset directory to write')
+    command.add_argument('--samples', type=int, default=1000)
+    command.add_argument('--theta', type=float, nargs=2, default=(-180, 180), metavar=('LOW', 'HIGH'))
+    command.add_argument('--alpha', type=float, nargs=2, default=(-30, 30), metavar=('LOW', 'HIGH'))
+    command.add_argument('--v', type=float, nargs=2, default=(50, 50), metavar=('LOW', 'HIGH'))
+    command.add_argument('--frames', type=int, default=50)
+    command.add_argument('--fps', type=int, default=50)
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--jobs', type=int, default=1)
+    command.add_argument('--closed-form', action='store_true', help='compute the frames in closed form')
+    command.set_defaults(run=collect)
+
+    command = commands.add_parser('pade', help='compute Q-tables and print the Q-label counts')
+    _add_dataset_arguments(command)
+    command.add_argument('--target', nargs='+', default=['v'], help='one or more pade targets (default: v)')
+    command.add_argument('--jobs', type=int, default=1)
+    command.add_argument('--output', help='.npy file to save the Q-table to')
+    command.set_defaults(run=run_pade)
+
+    command = commands.add_parser('tree', help='learn the decision tree and print its rules')
+    _add_tree_arguments(command)
+    command.set_defaults(run=tree)
+
+    command = commands.add_parser('plot', help='plot the decision tree')
+    _add_tree_arguments(command)
+    command.set_defaults(run=plot)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
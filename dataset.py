@@ -0,0 +1,118 @@
+import json
+import os
+import numpy as np
+
+# Columns of car_samples.csv as written by explore_car.py.
+CAR_SAMPLES_COLUMNS = ['theta', 'x', 'dx', 'gamma', 'v']
+
+
+# A dataset stored as a directory with one .npy file per column and a meta.json
+# with the column names and metadata about how the samples were generated.
+# meta.json also records the CSV file the dataset was last imported from or
+# exported to. Columns are memory-mapped and only read when they are accessed.
+class Dataset:
+    _path = None
+    _columns = None
+    _metadata = None
+    _length = 0
+    _csv = None          # path, modification time and size of the CSV file
+    _cache = None
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self._path = path
+        self._columns = meta['columns']
+        self._metadata = meta['metadata']
+        self._length = meta['length']
+        self._csv = meta.get('csv')
+        self._cache = {}
+
+    def __len__(self):
+        return self._length
+
+    def columns(self):
+        return list(self._columns)
+
+    def metadata(self):
+        return self._metadata
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            raise KeyError(name)
+        if name not in self._cache:
+            self._cache[name] = np.load(_column_path(self._path, name), mmap_mode='r')
+        return self._cache[name]
+
+    def select(self, names):
+        # The given columns as an (n, len(names)) array, in the given order.
+        return np.stack([self[name] for name in names], axis=1)
+
+    def to_array(self):
+        return self.select(self._columns)
+
+
+def _column_path(path, name):
+    return os.path.join(path, name + '.npy')
+
+
+# Save the (n, k) data with the k column names and optional metadata.
+def save_dataset(path, data, columns, metadata=None):
+    data = np.asarray(data)
+    if data.ndim != 2 or data.shape[1] != len(columns):
+        raise ValueError('data must have one column per name, got shape {} for {} columns'.format(data.shape, len(columns)))
+    os.makedirs(path, exist_ok=True)
+    for (i, name) in enumerate(columns):
+        np.save(_column_path(path, name), np.ascontiguousarray(data[:, i]))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'columns': list(columns), 'length': len(data), 'metadata': metadata or {}}, f, indent=2)
+    return Dataset(path)
+
+
+def load_dataset(path):
+    return Dataset(path)
+
+
+def _csv_fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    return {'path': os.path.abspath(csv_path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+# Record in meta.json that the dataset is the same as the CSV file.
+def _record_csv(path, csv_path):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    meta['csv'] = _csv_fingerprint(csv_path)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return Dataset(path)
+
+
+# Convert a headerless CSV file, as written by np.savetxt, into a dataset.
+def import_csv(csv_path, path, columns, metadata=None):
+    data = np.loadtxt(csv_path, delimiter=',', ndmin=2)
+    metadata = dict(metadata or {}, source=os.path.basename(csv_path))
+    save_dataset(path, data, columns, metadata)
+    return _record_csv(path, csv_path)
+
+
+# Write the dataset as a headerless CSV file, as read by np.loadtxt.
+def export_csv(dataset, csv_path):
+    np.savetxt(csv_path, dataset.to_array(), delimiter=',')
+    return _record_csv(dataset._path, csv_path)
+
+
+# Load a dataset, importing it from its CSV file the first time and again
+# whenever the CSV file is not the one recorded in the dataset. Without the
+# CSV file the dataset is loaded as it is. A reimport keeps the metadata, and
+# an existing dataset with other columns is never overwritten.
+def load_or_import(path, csv_path, columns):
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return import_csv(csv_path, path, columns)
+    existing = load_dataset(path)
+    if not os.path.exists(csv_path) or existing._csv == _csv_fingerprint(csv_path):
+        return existing
+    if set(existing.columns()) != set(columns):
+        raise ValueError('{} has the columns {}, not importing {} with the columns {} over it'.format(
+            path, existing.columns(), csv_path, list(columns)))
+    return import_csv(csv_path, path, columns, existing.metadata())
@@ -1,5 +1,6 @@
 import numpy as np
 
+import dataset
 from parking_simulator import ParkingSimulator
 
 # Repeat with different initial theta to cover all the space for theta in [-180, 180].
@@ -66,7 +67,15 @@ for initial_theta in initial_thetas:
         if current_sample_index >= total_samples:
             parking.stop()  # Stops the simulation. The run() function will return False in the next iteration.
 
-# Save data to CSV
-np.savetxt('car_samples.csv', data, delimiter=',')
+# Save data as a binary dataset with named columns, and export it to CSV.
+samples = dataset.save_dataset('car_samples.npds', data, dataset.CAR_SAMPLES_COLUMNS, metadata={
+    'initial_thetas': initial_thetas,
+    'samples_per_theta': samples_per_theta,
+    'goal_state': (640, 300, 0),
+    'goal_tolerance': (10, 10, 5),
+    'fps': 50,
+    'window_size': (1280, 720),
+})
+dataset.export_csv(samples, 'car_samples.csv')
 
 print("Data collection complete.")
\ No newline at end of file
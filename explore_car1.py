@@ -1,30 +1,26 @@
-import numpy as np
-import matplotlib.pyplot as plt
-from sklearn import tree
 from sklearn.tree import export_text
-import pade
-
-# Load data from CSV
-data = np.loadtxt('car_samples.csv', delimiter=',')
+import pipeline
+
+# Samples -> PADE -> Q-labels -> decision tree, every stage cached in .pipeline_cache
+qualitative = pipeline.QualitativePipeline(
+    features=['theta', 'dx', 'gamma'],  # Exclude 'x' to focus on 'theta'
+    target='v',
+    label_attributes=['gamma'],
+    dataset_path='car_samples.npds',
+    csv_path='car_samples.csv',
+    nNeighbours=10,
+    min_impurity_decrease=0.02
+)
+
+(data, columns) = qualitative.samples()
 print("Data shape:", data.shape)
 
-# Assign target and features
-target = data[:, 4]
-features = data[:, [0, 2, 3]]  # Exclude 'x' to focus on 'theta'
-
-print("Features shape:", features.shape)
-print("Target shape:", target.shape)
-
 # Train the qualitative model using PADE
-q_table = pade.pade(features, target, nNeighbours=10)
+q_table = qualitative.q_table()
 print("Q-table:", q_table)
-q_labels = pade.create_q_labels(q_table[:, 2:3], ['gamma'])
-
-classes, class_names = pade.enumerate_q_labels(q_labels)
 
 # Train decision tree
-classifier = tree.DecisionTreeClassifier(min_impurity_decrease=0.02)
-model = classifier.fit(features, classes)
+model = qualitative.model()
 
 # Display feature importance
 importance = model.feature_importances_
@@ -34,5 +30,4 @@ print("Feature importances:", importance)
 tree_rules = export_text(model, feature_names=['theta', 'dx', 'gamma'])
 print(tree_rules)
 
-tree.plot_tree(model, feature_names=['theta', 'dx', 'gamma'], class_names=class_names, filled=True)
-plt.show()
+qualitative.plot()
\ No newline at end of file
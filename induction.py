@@ -1,52 +1,12 @@
-import random
 import numpy as np
 from sklearn import tree
 import matplotlib.pyplot as plt
-from parking_simulator import ParkingSimulator
 import pade
+import sampling
 
-def get_sample(theta, alpha, v):
-    parking = ParkingSimulator(
-        initial_state=(0, 0, theta),
-        goal_state=(0, 0, 0),
-        goal_tolerance=(0, 0, 0),
-        visualize=False,
-        fps=50,
-        window_size=(1280, 720),
-        use_dqn_image=False
-    )
-
-    parking._car._alpha = alpha
-    parking._car._v = v
-    parking.run(frames=50)
-
-    (x, y, a, v, w) = parking.get_state()
-
-    dtheta = a - theta
-    if dtheta > 180:
-        dtheta -= 360
-    if dtheta < -180:
-        dtheta += 360
-
-    parking.reset()
-    return (x, y, dtheta)
-
-data = []
-for _ in range(1000):
-    theta = random.uniform(-180, 180)
-    alpha = random.uniform(-30, 30)
-    v = 50
-
-    gamma = theta + alpha
-    if gamma > 180:
-        gamma -= 360
-    if gamma < -180:
-        gamma += 360
-
-    (dx, dy, dtheta) = get_sample(theta, alpha, v)
-    data.append([theta, alpha, gamma, v, dx, dy, dtheta])
-
-data = np.array(data)
+# Simulate 1000 random (theta, alpha) pairs at v = 50 for 50 frames each.
+# Rows are (theta, alpha, gamma, v, dx, dy, dtheta).
+data = sampling.collect_samples(sampling.UniformControls(1000, v=(50, 50)), frames=50, fps=50)
 
 # Compute Pade values.
 #q_table = pade.pade(data[:,[0,1]], data[:,6]) # dtheta
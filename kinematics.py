@@ -0,0 +1,85 @@
+import numpy as np
+from parking_simulator import Car
+
+# Outputs of the kinematic model, named like the sampled columns.
+OUTPUTS = ('dx', 'dy', 'dtheta')
+
+
+# The kinematic model of the car as derived in calc.py, calcY.py and calcTh.py:
+#   x_dot = -v sin(theta + alpha), y_dot = v cos(theta + alpha), theta_dot = v sin(alpha) / (l / 2)
+# with the angles in degrees, as in the samples. The features a Q-table is built over
+# are any of theta, alpha, gamma = theta + alpha and v; without gamma the model is
+# written in theta and alpha, with gamma but without alpha, alpha is gamma - theta.
+# Partial derivatives are differentiated and compiled with sympy once per output and
+# feature set, after that a Q-table is a single vectorized numpy evaluation.
+class KinematicModel:
+    _axle_distance = 0
+    _compiled = None
+
+    def __init__(self, axle_distance = Car._axle_distance):
+        self._axle_distance = axle_distance
+        self._compiled = {}
+
+    def expressions(self, features):
+        # The sympy expressions of all outputs in terms of the given features.
+        import sympy as sp
+        (theta, alpha, gamma, v) = sp.symbols('theta alpha gamma v')
+        if 'gamma' not in features:
+            gamma = theta + alpha
+        elif 'alpha' not in features:
+            alpha = gamma - theta
+        rad = sp.pi / 180
+        return {
+            'dx': -v * sp.sin(gamma * rad),
+            'dy': v * sp.cos(gamma * rad),
+            'dtheta': v * sp.sin(alpha * rad) / (sp.Integer(self._axle_distance) / 2),
+        }
+
+    def derivatives(self, output, features, parameters = None):
+        # The compiled partial derivatives of output by each feature: a function of
+        # the feature columns returning a tuple of arrays (or scalars where constant).
+        # Symbols that are not features, such as v, must be given in parameters.
+        features = tuple(features)
+        parameters = tuple(sorted((parameters or {}).items()))
+        key = (output, features, parameters)
+        if key not in self._compiled:
+            import sympy as sp
+            if output not in OUTPUTS:
+                raise ValueError('unknown output {!r}, expected one of {}'.format(output, OUTPUTS))
+            symbols = [sp.Symbol(name) for name in features]
+            expression = self.expressions(features)[output].subs({sp.Symbol(name): value for (name, value) in parameters})
+            missing = expression.free_symbols - set(symbols)
+            if missing:
+                raise ValueError('{} depends on {}, give them as features or parameters'.format(
+                    output, sorted(str(symbol) for symbol in missing)))
+            gradient = [sp.diff(expression, symbol) for symbol in symbols]
+            self._compiled[key] = sp.lambdify(symbols, gradient, 'numpy')
+        return self._compiled[key]
+
+    def q_table(self, data, features, output, parameters = None, tolerance = 1e-9):
+        # The Q-table of the true derivative signs of output over the (n, d) data with
+        # the d named features, in the same int8 form as pade.pade returns. Derivatives
+        # within the tolerance of 0 have sign 0.
+        data = np.asarray(data, dtype=float)
+        gradient = self.derivatives(output, features, parameters)(*data.T)
+        q_table = np.empty(data.shape, dtype=np.int8)
+        for (dim, derivative) in enumerate(gradient):
+            derivative = np.broadcast_to(np.asarray(derivative, dtype=float), len(data))
+            q_table[:, dim] = np.where(np.abs(derivative) > tolerance, np.sign(derivative), 0)
+        return q_table
+
+    def q_tables(self, data, features, outputs = OUTPUTS, parameters = None, tolerance = 1e-9):
+        # One Q-table per output, like pade.pade with a 2-D target.
+        return [self.q_table(data, features, output, parameters, tolerance) for output in outputs]
+
+
+_model = None
+
+
+# Analytic alternative to pade.pade(data, target): the Q-table of the given
+# output ('dx', 'dy' or 'dtheta') over data with the named feature columns.
+def q_table(data, features, output, parameters = None):
+    global _model
+    if _model is None:
+        _model = KinematicModel()
+    return _model.q_table(data, features, output, parameters)
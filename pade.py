@@ -1,118 +1,684 @@
+import itertools
 import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
+from numpy.lib.format import open_memmap
+from scipy.spatial import cKDTree
 
 
-def _get_tube_neighbours(data, ref_idx, tube_dimension, n):
-    # Get the data of the reference sample.
-    ref = data[ref_idx]
+# Relative and absolute slack between the KD-tree distances and the exact ones.
+_RTOL = 1e-9
+_ATOL = 1e-12
 
-    # Compute the distances from the reference sample.
-    distances = []
-    for idx, _ in enumerate(data):
-        # Skip the reference sample.
-        if idx == ref_idx:
-            continue
 
-        # Euclidean distance along all dimensions, except the tube dimension.
-        dist = 0
-        for dim, _ in enumerate(ref):
-            if dim != tube_dimension:
-                dist += (data[idx][dim] - ref[dim]) ** 2
-        distances.append((idx, math.sqrt(dist)))
+def _tube_distances(points, refs, candidates):
+    # Euclidean distances from refs (m, d) to the candidate rows (m, c), summed
+    # dimension by dimension.
+    dist = np.zeros(candidates.shape)
+    for dim in range(points.shape[1]):
+        dist = dist + (points[candidates, dim] - refs[:, dim, None]) ** 2
+    return np.sqrt(dist)
 
-    # Sort by distances and return the indices of n closest neighbours.
-    distances = sorted(distances, key=lambda x: x[1])
-    return [i for (i, _) in distances[:n]]
 
+def _rank_tube_candidates(points, rows, candidates, n):
+    # Order the candidates by exact distance and then by index, with the sample
+    # itself last, and keep the first n.
+    dist = _tube_distances(points, points[rows], candidates)
+    dist[candidates == rows[:, None]] = np.inf
+    order = np.lexsort((candidates, dist))[:, :n]
+    return (np.take_along_axis(candidates, order, axis=1),
+            np.take_along_axis(dist, order, axis=1))
+
+
+def _tube_points(data, tube_dimension):
+    # The tube is spanned by the tube dimension, so distances ignore it.
+    return np.ascontiguousarray(np.delete(data, tube_dimension, axis=1), dtype=float)
+
+
+def _build_tube_index(data, tube_dimension):
+    points = _tube_points(data, tube_dimension)
+    if points.shape[1] == 0:
+        return points, None
+    return points, cKDTree(points)
+
+
+# A KD-tree index over points that keep being appended, answering the same
+# queries as a cKDTree over all of them. It is a list of cKDTrees over
+# consecutive ranges of points with decreasing sizes: each batch gets its own
+# tree, and trees that are not larger than the one after them are merged, so
+# every point is only rebuilt into a tree a logarithmic number of times.
+class _TubeForest:
+    _trees = None   # (start, cKDTree) pairs
+
+    def __init__(self):
+        self._trees = []
+
+    def append(self, points, start):
+        # Index points[start:], points[:start] must be indexed already.
+        stop = len(points)
+        while self._trees and self._trees[-1][1].n <= stop - start:
+            start = self._trees.pop()[0]
+        # The trees keep their points, copy them so that points is not kept alive.
+        self._trees.append((start, cKDTree(points[start:stop].copy())))
+
+    def query(self, x, k):
+        # Distances and indices of the k nearest points to every row of x, as (m, k) arrays.
+        dist = []
+        index = []
+        for (start, tree) in self._trees:
+            kTree = min(k, tree.n)
+            (d, i) = tree.query(x, k=kTree)
+            dist.append(d.reshape(len(x), kTree))
+            index.append(i.reshape(len(x), kTree) + start)
+        (dist, index) = (np.concatenate(dist, axis=1), np.concatenate(index, axis=1))
+        order = np.argsort(dist, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(dist, order, axis=1), np.take_along_axis(index, order, axis=1)
+
+    def query_ball_point(self, x, r):
+        # Indices of all points within distance r of the point x.
+        return [start + i for (start, tree) in self._trees for i in tree.query_ball_point(x, r)]
+
+
+def _query_tube_neighbours(points, tree, rows, n):
+    # Neighbours of the given rows as an (m, n) array: for every row the n other
+    # samples closest to it, ties broken by the lower index.
+    rows = np.asarray(rows, dtype=np.intp)
+
+    # Without any other dimension every sample is at distance 0, so the
+    # neighbours are simply the first n indices other than the sample itself.
+    if tree is None:
+        first = np.arange(n)
+        return first + (first >= rows[:, None])
+
+    # Query two extra candidates: the sample itself is normally among them, and
+    # the one after the n-th neighbour shows whether the cut falls between ties.
+    k = min(n + 2, len(points))
+    kd_dist, candidates = tree.query(points[rows], k=k)
+    candidates = candidates.reshape(len(rows), k)
+    kd_dist = kd_dist.reshape(len(rows), k)
+    (ranked, dist) = _rank_tube_candidates(points, rows, candidates, k)
+    neighbours = ranked[:, :n]
+    if k == len(points):
+        return neighbours
+
+    # The first candidate that is not kept, and every sample outside the candidates,
+    # is at least as far as the following distance. Only if the n-th neighbour is not
+    # clearly closer than that can there be ties across the cut, and then every
+    # sample within its distance is ranked.
+    boundary = dist[:, n - 1]
+    following = np.minimum(dist[:, n], kd_dist[:, -1])
+    ambiguous = np.flatnonzero(boundary >= following * (1 - _RTOL) - _ATOL)
+    for i in ambiguous:
+        radius = boundary[i] * (1 + _RTOL) + _ATOL
+        ball = np.array(sorted(tree.query_ball_point(points[rows[i]], radius)), dtype=np.intp)
+        neighbours[i] = _rank_tube_candidates(points, rows[i:i + 1], ball[None, :], n)[0][0]
+
+    return neighbours
+
+
+def _merge_tube_neighbours(points, index, neighbours, boundary, nOld):
+    # Update the (nOld, n) neighbours of the old samples, whose farthest neighbours
+    # are at the boundary distances, after points[nOld:] were appended and added to
+    # the index. A neighbourhood changes only if a new sample is not farther than
+    # its boundary, and then it is made of the closest of the old neighbours and
+    # the new samples. Returns the rows that changed.
+    n = neighbours.shape[1]
+    new = cKDTree(points[nOld:])
+    bound = boundary[:nOld] * (1 + _RTOL) + _ATOL
+    (nearest, _) = new.query(points[:nOld], distance_upper_bound=bound.max() * (1 + _RTOL))
+    rows = np.flatnonzero(nearest <= bound)
+
+    k = min(n, new.n)
+    (kd_dist, candidates) = new.query(points[rows], k=k)
+    (kd_dist, candidates) = (kd_dist.reshape(len(rows), k), candidates.reshape(len(rows), k))
+    found = kd_dist <= bound[rows, None]
+    candidates = np.where(found, candidates + nOld, rows[:, None])
+    (ranked, dist) = _rank_tube_candidates(points, rows, np.concatenate((neighbours[rows], candidates), axis=1), n)
+    neighbours[rows] = ranked
+
+    # If all n new candidates are within the boundary, new samples that were not
+    # returned may tie with the n-th neighbour, so those rows are queried in full.
+    if k == n:
+        ambiguous = rows[found[:, -1] & (dist[:, -1] >= kd_dist[:, -1] * (1 - _RTOL) - _ATOL)]
+        if len(ambiguous) > 0:
+            neighbours[ambiguous] = _query_tube_neighbours(points, index, ambiguous, n)
+    return rows
+
+
+def _get_all_tube_neighbours(data, tube_dimension, n):
+    # Neighbours of every sample within the tube along the given dimension.
+    # Returns None if there are not enough samples to find n neighbours.
+    if len(data) - 1 < n:
+        return None
+    (points, tree) = _build_tube_index(data, tube_dimension)
+    return _query_tube_neighbours(points, tree, np.arange(len(data)), n)
+
+
+def _tube_regression(neighbours_x, x0, values):
+    # Weighted univariate linear regression for a batch of tubes. Row i of the
+    # (n, k) neighbours_x and values arrays holds the neighbours of the sample
+    # with value x0[i]; returns the n slopes. values may have a trailing axis of
+    # t targets, (n, k, t), in which case the weights are shared by all targets
+    # and the (n, t) slopes are returned.
+
+    # Compute the distance of the farthest neighbour.
+    max_distance = np.max(np.abs(neighbours_x - x0[:, None]), axis=1)
+
+    # Compute the sigma parameter so that the weight of the farthest sample is 0.001.
+    sg = np.full(max_distance.shape, math.log(.001))
+    far = max_distance >= 1e-10
+    sg[far] /= max_distance[far] ** 2
+
+    # Accumulate the weighted sums neighbour by neighbour, in the same order as
+    # the scalar regression, so that the slopes do not depend on the batch.
+    targets = (slice(None),) + (None,) * (values.ndim - 2)
+    Sx = Sxx = n = np.zeros(len(x0))
+    Sy = Sxy = np.zeros((len(x0),) + values.shape[2:])
+    for j in range(neighbours_x.shape[1]):
+        x = neighbours_x[:, j]
+        y = values[:, j]
+        w = np.exp(sg * (x - x0) ** 2)
+        Sx = Sx + w * x
+        Sy = Sy + w[targets] * y
+        Sxx = Sxx + w * x ** 2
+        Sxy = Sxy + (w * x)[targets] * y
+        n = n + w
+    div = n * Sxx - Sx ** 2
+
+    # Leave the slope at 0 where the regression is degenerate.
+    b = np.zeros(Sy.shape)
+    valid = div != 0
+    b[valid] = (Sxy[valid] * n[valid][targets] - Sx[valid][targets] * Sy[valid]) / div[valid][targets]
+    return b
+
+
+def _tube_signs(data, target, dim, rows, neighbours):
+    # Signs of the partial derivatives along dim for the given rows, whose
+    # tube neighbours are in the matching rows of neighbours. With an (N, t)
+    # target the signs of all targets are returned as an (m, t) array.
+    return _column_signs(data[:, dim], target, rows, neighbours)
+
+
+def _column_signs(x, target, rows, neighbours):
+    # The same for the values x of the tube dimension given as a single column.
+    x0 = x[rows]
+    neighbours_x = x[neighbours]
+    values = np.take(target, neighbours, axis=0)
+    return np.sign(_tube_regression(neighbours_x, x0, values))
+
+
+# Shared data and cached tube indices of a pade worker process.
+_worker_arrays = None
+_worker_indices = {}
+
+
+def _init_pade_worker(data_spec, target_spec):
+    global _worker_arrays
+    arrays = []
+    for (name, shape, dtype) in (data_spec, target_spec):
+        shm = shared_memory.SharedMemory(name=name)
+        arrays.append((shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)))
+    _worker_arrays = arrays
+    _worker_indices.clear()
+
+
+def _pade_worker_task(dim, start, stop, nNeighbours):
+    # Process one chunk of samples along one dimension in a worker process.
+    ((_, data), (_, target)) = _worker_arrays
+    if dim not in _worker_indices:
+        _worker_indices[dim] = _build_tube_index(data, dim)
+    (points, tree) = _worker_indices[dim]
+
+    rows = np.arange(start, stop)
+    neighbours = _query_tube_neighbours(points, tree, rows, nNeighbours)
+    return dim, start, _tube_signs(data, target, dim, rows, neighbours)
+
+
+def _share_array(array):
+    # Copy an array into a new shared memory block.
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype)
+
+
+def _pade_parallel(data, target, nNeighbours, n_jobs, chunk_size, q_table):
+    (nSamples, nAttributes) = data.shape
+    if chunk_size is None:
+        chunk_size = max(1, -(-nSamples // (4 * n_jobs)))
+
+    # The workers read the data and target from shared memory instead of receiving pickled copies.
+    (data_shm, data_spec) = _share_array(np.ascontiguousarray(data, dtype=float))
+    (target_shm, target_spec) = _share_array(np.ascontiguousarray(target))
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_pade_worker,
+                                 initargs=(data_spec, target_spec)) as executor:
+            # Split the work by dimension and by chunks of samples.
+            futures = [
+                executor.submit(_pade_worker_task, dim, start, min(start + chunk_size, nSamples), nNeighbours)
+                for dim in range(nAttributes)
+                for start in range(0, nSamples, chunk_size)
+            ]
+            for future in futures:
+                (dim, start, signs) = future.result()
+                q_table[:, start:start + len(signs), dim] = signs.T
+    finally:
+        for shm in (data_shm, target_shm):
+            shm.close()
+            shm.unlink()
+
+    return q_table
+
+
+def pade(data, target, nNeighbours=10, n_jobs=1, chunk_size=None):
+    # The target is either one column of N values or an (N, t) array of t
+    # targets; in the latter case a list of t Q-tables is returned, computed
+    # with one neighbour search and one set of regression weights.
 
-def pade(data, target, nNeighbours=10):
     # Get the data dimension.
-    (_, nAttributes) = data.shape
+    (nSamples, nAttributes) = data.shape
+    targets = np.asarray(target).reshape(nSamples, -1)
+
+    # Initialize the Q-tables of int8 signs with the same dimension as data.
+    q_table = np.zeros((targets.shape[1],) + data.shape, dtype=np.int8)
+
+    # If not enough neighbours, leave the Q-tables empty.
+    if nSamples - 1 >= nNeighbours:
+        # Distribute the tube regressions over a pool of worker processes (all cores if n_jobs is None or -1).
+        if n_jobs is None or n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+        if n_jobs > 1:
+            _pade_parallel(data, targets, nNeighbours, n_jobs, chunk_size, q_table)
+        else:
+            # Make a tube regression along each dimension.
+            rows = np.arange(nSamples)
+            for dim in range(nAttributes):
+                # Get the indices of the nearest neighbours within the tube for all samples.
+                neighbours = _get_all_tube_neighbours(data, dim, nNeighbours)
+
+                # Store the signs of the partial derivatives to the Q-tables.
+                q_table[:, :, dim] = _tube_signs(data, targets, dim, rows, neighbours).T
+
+    # Return the Q-table, or one Q-table per target.
+    if np.ndim(target) == 1:
+        return q_table[0]
+    return list(q_table)
+
+
+def pade_sweep(data, target, nNeighbours=(5, 10, 20, 50)):
+    # Q-tables for several nNeighbours values from one neighbour search. The
+    # neighbour lists are sorted by distance (ties by index), so the k nearest
+    # neighbours are the first k of the k_max nearest, and every Q-table is
+    # identical to pade(data, target, k). Returns the Q-tables by k and the
+    # agreement matrix: the fraction of samples whose Q-table rows (that is,
+    # whose Q-labels over all attributes) are the same for each pair of k values.
+    ks = sorted(set(nNeighbours))
+    (nSamples, nAttributes) = data.shape
+    q_tables = {k: np.zeros(data.shape, dtype=np.int8) for k in ks}
+
+    # Values of k with too few samples leave their Q-tables empty, like pade.
+    valid = [k for k in ks if nSamples - 1 >= k]
+    if valid:
+        rows = np.arange(nSamples)
+        for dim in range(nAttributes):
+            neighbours = _get_all_tube_neighbours(data, dim, valid[-1])
+            for k in valid:
+                q_tables[k][:, dim] = _tube_signs(data, target, dim, rows, neighbours[:, :k])
+
+    agreement = np.ones((len(ks), len(ks)))
+    for (i, a) in enumerate(ks):
+        for (j, b) in enumerate(ks[:i]):
+            agreement[i, j] = agreement[j, i] = np.mean(np.all(q_tables[a] == q_tables[b], axis=1)) if nSamples else 1.0
+
+    return q_tables, {'nNeighbours': ks, 'agreement': agreement}
+
+
+def _get_grid_tube_neighbours(points, n, occupancy=3.0, chunk_size=8192):
+    # Approximate tube neighbours of all samples from a grid of cubic cells: the
+    # n samples closest to each sample among those in its own and the adjacent
+    # cells, at most 4 * occupancy per run of three cells along the last axis.
+    # The cell size is chosen so that the cell of a sample holds about
+    # occupancy samples.
+    (nSamples, nDims) = points.shape
+    if nDims == 0:
+        return _query_tube_neighbours(points, None, np.arange(nSamples), n)
+    capacity = int(math.ceil(4 * occupancy))
 
-    # Initialize the Q-table with the same dimension as data.
-    q_table = np.zeros(data.shape)
+    # Shrink the cells until the occupancy seen by the samples is about right.
+    low = points.min(axis=0)
+    extent = points.max(axis=0) - low
+    size = max(extent.max(), 1e-300) / max(1.0, (nSamples / occupancy) ** (1 / nDims))
+    shape = np.floor(extent / size).astype(np.int64) + 1
+    for attempt in range(5):
+        cells = np.minimum(((points - low) / size).astype(np.int64), shape - 1)
+        cell = np.ravel_multi_index(tuple(cells.T), shape)
+        order = np.argsort(cell, kind='stable')
+        sorted_cell = cell[order]
+        first = np.flatnonzero(np.r_[True, sorted_cell[1:] != sorted_cell[:-1]])
+        seen = np.sum(np.diff(np.r_[first, nSamples]).astype(float) ** 2) / nSamples
+        if seen <= 2 * occupancy or attempt == 4:
+            break
+        smaller = size / (seen / occupancy) ** (1 / nDims)
+        if np.prod(np.floor(extent / smaller) + 1) > 2 ** 62:
+            break
+        size = smaller
+        shape = np.floor(extent / size).astype(np.int64) + 1
 
-    # Make a tube regression along each dimension.
+    # Work on the samples sorted by cell, so that the samples of a cell and of the
+    # cells next to it along the last axis are one contiguous range, taken as a
+    # window of capacity samples that are masked past the end of the range.
+    sorted_cells = cells[order]
+    strides = np.ones(nDims, dtype=np.int64)
+    for dim in range(nDims - 2, -1, -1):
+        strides[dim] = strides[dim + 1] * shape[dim + 1]
+    last = sorted_cells[:, -1]
+    (starts, counts) = ([], [])
+    for offset in itertools.product((-1, 0, 1), repeat=nDims - 1):
+        around = sorted_cells[:, :-1] + offset
+        inside = np.all((around >= 0) & (around < shape[:-1]), axis=1)
+        base = around @ strides[:-1]
+        lo = np.searchsorted(sorted_cell, base + np.maximum(last - 1, 0))
+        hi = np.searchsorted(sorted_cell, base + np.minimum(last + 1, shape[-1] - 1), side='right')
+        starts.append(lo)
+        counts.append(np.where(inside, np.minimum(hi - lo, capacity), 0))
+    (starts, counts) = (np.array(starts), np.array(counts))
+    sorted_points = points[order]
+    padded = np.zeros((nDims, nSamples + capacity))
+    padded[:, :nSamples] = sorted_points.T
+    windows = [np.lib.stride_tricks.sliding_window_view(column, capacity) for column in padded]
+
+    # The candidates of a row are numbered range by range, capacity per range.
+    # The sample itself is in the range of its own cells.
+    own = len(starts) // 2
+    window = np.arange(capacity)
+    neighbours = np.empty((nSamples, n), dtype=np.intp)
+    for start in range(0, nSamples, chunk_size):
+        rows = np.arange(start, min(start + chunk_size, nSamples))
+        dist = np.zeros((len(rows), len(starts), capacity))
+        for (k, lo) in enumerate(starts[:, rows]):
+            for dim in range(nDims):
+                difference = np.subtract(windows[dim][lo], padded[dim, rows, None])
+                dist[:, k] += np.square(difference, out=difference)
+            dist[:, k][window >= counts[k, rows, None]] = np.inf
+        position = rows - starts[own, rows]
+        itself = position < capacity
+        dist[np.flatnonzero(itself), own, position[itself]] = np.inf
+        dist = dist.reshape(len(rows), -1)
+        nearest = np.argpartition(dist, n - 1, axis=1)[:, :n]
+        (k, j) = np.divmod(nearest, capacity)
+        neighbours[rows] = starts[k, rows[:, None]] + j
+
+        # Samples with fewer than n candidates, at the borders of sparse regions,
+        # also take the n samples before and after them in cell order.
+        for i in np.flatnonzero(np.isinf(np.take_along_axis(dist, nearest, axis=1)).any(axis=1)):
+            (k, j) = np.divmod(np.flatnonzero(np.isfinite(dist[i])), capacity)
+            first = max(0, min(rows[i] - n, nSamples - 2 * n - 1))
+            candidates = np.union1d(starts[k, rows[i]] + j, np.arange(first, min(first + 2 * n + 1, nSamples)))
+            neighbours[rows[i]] = _rank_tube_candidates(sorted_points, rows[i:i + 1], candidates[None, :], n)[0][0]
+
+    # Back to the original order.
+    result = np.empty((nSamples, n), dtype=np.intp)
+    result[order] = order[neighbours]
+    return result
+
+
+def _check_tube_neighbours(points, rows, neighbours, n):
+    # Exact neighbours of the given rows, whose approximate neighbours are given.
+    # The exact n-th neighbour is not farther than the farthest approximate one,
+    # so only the samples within that distance along the widest dimension are
+    # ranked, which needs one sort instead of a KD-tree over all samples.
+    if points.shape[1] == 0:
+        return _query_tube_neighbours(points, None, rows, n)
+    dim = np.argmax(points.max(axis=0) - points.min(axis=0))
+    order = np.argsort(points[:, dim], kind='stable')
+    values = points[order, dim]
+    radius = _tube_distances(points, points[rows], neighbours).max(axis=1) * (1 + _RTOL) + _ATOL
+    lo = np.searchsorted(values, points[rows, dim] - radius, side='left')
+    hi = np.searchsorted(values, points[rows, dim] + radius, side='right')
+    exact = np.empty((len(rows), n), dtype=np.intp)
+    for i in range(len(rows)):
+        candidates = order[lo[i]:hi[i]]
+        near = _tube_distances(points, points[rows[i:i + 1]], candidates[None, :])[0] <= radius[i]
+        candidates = np.sort(candidates[near])
+        exact[i] = _rank_tube_candidates(points, rows[i:i + 1], candidates[None, :], n)[0][0]
+    return exact
+
+
+def approximate_pade(data, target, nNeighbours=10, nCheck=1000, seed=0, occupancy=3.0):
+    # PADE with approximate tube neighbours from a grid of cells instead of exact
+    # nearest neighbours; a lower occupancy ranks fewer candidates and is less
+    # accurate. The signs of nCheck random samples are compared against exact
+    # neighbours, and the report gives the number of differing signs and a 95%
+    # upper bound on the fraction of differing signs in the Q-table.
+    rng = np.random.default_rng(seed)
+    (nSamples, nAttributes) = data.shape
+    q_table = np.zeros(data.shape, dtype=np.int8)
+    report = {'checked': 0, 'differing': 0, 'per_dimension': [0] * nAttributes,
+              'fraction': 0.0, 'upper_bound': 0.0}
+    if nSamples - 1 < nNeighbours:
+        return q_table, report
+
+    # Make an approximate tube regression along each dimension, and compare a
+    # random subsample against the exact neighbours.
+    rows = np.arange(nSamples)
+    check = np.sort(rng.choice(nSamples, size=min(nCheck, nSamples), replace=False))
     for dim in range(nAttributes):
-        # Process all samples along the current dimension.
-        for idx, sample in enumerate(data):
-            # Get the sample value.
-            x0 = sample[dim]
+        points = _tube_points(data, dim)
+        neighbours = _get_grid_tube_neighbours(points, nNeighbours, occupancy)
+        q_table[:, dim] = _tube_signs(data, target, dim, rows, neighbours)
+        exact = _check_tube_neighbours(points, check, neighbours[check], nNeighbours)
+        signs = _tube_signs(data, target, dim, check, exact)
+        report['per_dimension'][dim] = int(np.count_nonzero(signs != q_table[check, dim]))
 
-            # Get the indices of the nearest neighbours within the tube.
-            neighbours = _get_tube_neighbours(data, idx, dim, nNeighbours)
+    # Hoeffding bound on the fraction of differing signs over the whole Q-table.
+    checked = len(check) * nAttributes
+    report['checked'] = checked
+    report['differing'] = sum(report['per_dimension'])
+    report['fraction'] = report['differing'] / checked
+    report['upper_bound'] = min(1.0, report['fraction'] + math.sqrt(math.log(1 / 0.05) / (2 * len(check))))
 
-            # If not enough neighbours, skip this sample.
-            if len(neighbours) < nNeighbours:
-                continue
+    return q_table, report
 
-            # Take the target values of the returned neighbours.
-            values = np.take(target, neighbours, axis=0)
 
-            # Get the x values of the nearest neighbours.
-            neighbours_x = np.take(data, neighbours, axis=0)[:, dim]
+def pade_chunked(columns, target, q_table_path, nNeighbours=10, chunk_size=65536, temp_dir=None):
+    # PADE for datasets larger than memory. The attributes are given as a list of
+    # columns (for example memory-mapped Dataset columns) or as an (n, d) array,
+    # and the samples are processed in blocks of chunk_size rows. The tube points
+    # of every dimension are written to a temporary memory-mapped file that the
+    # KD-tree uses without copying, and the Q-table is written as int8 signs to a
+    # memory-mapped .npy file at q_table_path, which is returned.
+    if not isinstance(columns, (list, tuple)):
+        columns = [columns[:, dim] for dim in range(columns.shape[1])]
+    nAttributes = len(columns)
+    nSamples = len(columns[0])
 
-            # Compute the distance of the farthest neighbour.
-            max_distance = max([abs(x - x0) for x in neighbours_x])
+    q_table = open_memmap(q_table_path, mode='w+', dtype=np.int8, shape=(nSamples, nAttributes))
+    q_table[...] = 0
 
-            # Compute the sigma parameter so that the weight of the farthest sample is 0.001.
-            if max_distance < 1e-10:
-                sg = math.log(.001)
-            else:
-                sg = math.log(.001) / max_distance ** 2
-
-            # Compute the weighted univariate linear regression.
-            Sx = Sy = Sxx = Syy = Sxy = n = 0.0
-            for (x, y) in zip(neighbours_x, values):
-                w = math.exp(sg * (x - x0) ** 2)
-                Sx += w * x
-                Sy += w * y
-                Sxx += w * x ** 2
-                Syy += w * y ** 2
-                Sxy += w * x * y
-                n += w
-            div = n * Sxx - Sx ** 2
-            if div != 0:
-                b = (Sxy * n - Sx * Sy) / div
+    # If not enough neighbours, leave the Q-table empty.
+    if nSamples - 1 < nNeighbours:
+        q_table.flush()
+        return q_table
+
+    with tempfile.TemporaryDirectory(dir=temp_dir) as tmp:
+        for dim in range(nAttributes):
+            # Copy the other dimensions block by block into the tube points file.
+            others = [column for (i, column) in enumerate(columns) if i != dim]
+            tree = None
+            if others:
+                points = open_memmap(os.path.join(tmp, 'points.npy'), mode='w+', dtype=float, shape=(nSamples, len(others)))
+                for start in range(0, nSamples, chunk_size):
+                    stop = min(start + chunk_size, nSamples)
+                    for (i, column) in enumerate(others):
+                        points[start:stop, i] = column[start:stop]
+                tree = cKDTree(points, copy_data=False)
             else:
-                b = 0
+                points = np.zeros((nSamples, 0))
+
+            # Make the tube regressions block by block.
+            for start in range(0, nSamples, chunk_size):
+                rows = np.arange(start, min(start + chunk_size, nSamples))
+                neighbours = _query_tube_neighbours(points, tree, rows, nNeighbours)
+                q_table[rows, dim] = _column_signs(columns[dim], target, rows, neighbours)
 
-            # Store the sign of the partial derivative to the Q-table.
-            #print(b)
-            q_table[idx][dim] = np.sign(b)
-            #q_table[idx][dim] = np.sign(b)
+            # Release the points file before it is overwritten or removed.
+            del tree, points
 
-    # Return the Q-table.
+    q_table.flush()
     return q_table
 
 
 # Translate the signs to the Q-notation.
-def create_q_labels(q_table, attribute_names):
-    labels = []
+def _q_label(signs, attribute_names):
+    terms = []
+    for name, value in zip(attribute_names, signs):
+        if value > 0:
+            terms.append('+{}'.format(name))
+        elif value < 0:
+            terms.append('-{}'.format(name))
+    return 'Q({})'.format(', '.join(terms))
+
+
+# Group the samples by their sign vectors. Returns the unique sign vectors and
+# the index of every sample's sign vector.
+def _unique_signs(q_table):
+    signs = np.sign(np.asarray(q_table)).astype(np.int8).reshape(len(q_table), -1)
 
-    for sample in q_table:
-        label = 'Q('
-        for name, value in zip(attribute_names, sample):
-            if value > 0:
-                if label != 'Q(':
-                    label += ', '
-                label += '+{}'.format(name)
-            elif value < 0:
-                if label != 'Q(':
-                    label += ', '
-                label += '-{}'.format(name)
-        label += ')'
-        labels.append(label)
+    # Encode every sign vector as a base-3 number, which is much faster to make
+    # unique than the rows themselves. With few attributes the numbers are
+    # counted instead of sorted.
+    nAttributes = signs.shape[1]
+    if nAttributes <= 39:
+        keys = (signs + 1).astype(np.int64) @ (3 ** np.arange(nAttributes, dtype=np.int64))
+        if nAttributes <= 12:
+            present = np.bincount(keys, minlength=3 ** nAttributes) > 0
+            unique_keys = np.flatnonzero(present)
+            inverse = (np.cumsum(present) - 1)[keys]
+            unique = (unique_keys[:, None] // 3 ** np.arange(nAttributes) % 3 - 1).astype(np.int8)
+            return unique, inverse
+        (_, first, inverse) = np.unique(keys, return_index=True, return_inverse=True)
+        return signs[first], inverse.reshape(-1)
+    (unique, inverse) = np.unique(signs, axis=0, return_inverse=True)
+    return unique, inverse.reshape(-1)
 
-    return np.array(labels)
+
+def create_q_labels(q_table, attribute_names):
+    # Build the label strings only for the unique sign vectors.
+    if len(q_table) == 0:
+        return np.array([])
+    (unique, inverse) = _unique_signs(q_table)
+    labels = np.array([_q_label(signs, attribute_names) for signs in unique])
+    return labels[inverse]
 
 
 # Translate the Q-labels to enumerated classes 0, 1, 2, ...
 def enumerate_q_labels(q_labels):
-    # The unique class names.
-    class_names = np.unique(q_labels)
+    # The unique class names and the class of every label.
+    (class_names, classes) = np.unique(q_labels, return_inverse=True)
+
+    return classes.reshape(-1), class_names
+
+
+# Enumerate the classes straight from the Q-table, the same as
+# enumerate_q_labels(create_q_labels(q_table, attribute_names)).
+def enumerate_q_table(q_table, attribute_names):
+    (unique, inverse) = _unique_signs(q_table)
+    labels = np.array([_q_label(signs, attribute_names) for signs in unique])
+
+    # Number the classes in the sorted order of their names.
+    order = np.argsort(labels)
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    return rank[inverse], labels[order]
+
+
+# The array, or a copy grown by at least half, with room for size rows.
+def _reserve(array, size):
+    if len(array) >= size:
+        return array
+    grown = np.zeros((max(size, len(array) * 3 // 2),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+# PADE that is updated as batches of samples arrive. Only the Q-table rows
+# whose tube neighbourhoods changed are recomputed, and the Q-table is always
+# equal to running pade on all samples collected so far.
+class IncrementalPade:
+    _nNeighbours = 10
+    _size = 0            # number of samples, the arrays below are allocated in chunks
+    _data = None
+    _target = None
+    _q_table = None
+    _neighbours = None   # tube neighbours of every sample, per dimension
+    _boundary = None     # distance of the farthest tube neighbour, per dimension
+    _index = None        # _TubeForest over the tube points, per dimension
+
+    def __init__(self, nNeighbours=10):
+        self._nNeighbours = nNeighbours
+
+    def partial_fit(self, data, target):
+        data = np.asarray(data, dtype=float)
+        target = np.asarray(target)
+        n = self._nNeighbours
+        nOld = self._size
+        nSamples = nOld + len(data)
+        nAttributes = data.shape[1]
+        if self._data is None:
+            self._data = np.zeros((0, nAttributes))
+            self._target = np.zeros((0,) + target.shape[1:], dtype=target.dtype)
+            self._q_table = np.zeros((0, nAttributes), dtype=np.int8)
+            self._neighbours = [np.zeros((0, n), dtype=np.intp) for _ in range(nAttributes)]
+            self._boundary = [np.zeros(0) for _ in range(nAttributes)]
+            self._index = [_TubeForest() for _ in range(nAttributes)]
+        self._data = _reserve(self._data, nSamples)
+        self._target = _reserve(self._target, nSamples)
+        self._q_table = _reserve(self._q_table, nSamples)
+        self._data[nOld:nSamples] = data
+        self._target[nOld:nSamples] = target
+        self._size = nSamples
+
+        allData = self._data[:nSamples]
+        allTarget = self._target[:nSamples]
+        old_q_table = self._q_table[:nOld].copy()
+
+        for dim in range(nAttributes):
+            points = _tube_points(allData, dim)
+            index = self._index[dim] if points.shape[1] > 0 else None
+            if index is not None:
+                index.append(points, nOld)
+
+            # If not enough neighbours, the Q-table stays empty.
+            if nSamples - 1 < n:
+                continue
+
+            neighbours = self._neighbours[dim] = _reserve(self._neighbours[dim], nSamples)
+            boundary = self._boundary[dim] = _reserve(self._boundary[dim], nSamples)
+            if nOld - 1 < n:
+                # No neighbourhoods yet, compute all of them.
+                rows = np.arange(nSamples)
+                neighbours[rows] = _query_tube_neighbours(points, index, rows, n)
+            else:
+                # New samples have larger indices, so they do not win ties against
+                # the old neighbours, and without other dimensions they never do.
+                rows = np.arange(nOld, nSamples)
+                neighbours[rows] = _query_tube_neighbours(points, index, rows, n)
+                if index is not None:
+                    changed = _merge_tube_neighbours(points, index, neighbours, boundary, nOld)
+                    rows = np.concatenate((changed, rows))
+
+            # Recompute the farthest neighbours and Q-table rows of the changed neighbourhoods.
+            if len(rows) > 0:
+                boundary[rows] = _tube_distances(points, points[rows], neighbours[rows, -1:])[:, 0]
+                self._q_table[rows, dim] = _tube_signs(allData, allTarget, dim, rows, neighbours[rows])
+
+        # Return the number of old samples whose Q-table row changed.
+        return int(np.count_nonzero(np.any(self._q_table[:nOld] != old_q_table, axis=1)))
 
-    # Enumerate classes.
-    classes = np.array([np.where(class_names == q_label)[0][0] for q_label in q_labels])
+    def get_q_table(self):
+        return self._q_table[:self._size]
 
-    return classes, class_names
\ No newline at end of file
+    def get_q_labels(self, attribute_names):
+        return create_q_labels(self.get_q_table(), attribute_names)
@@ -32,8 +32,46 @@ class Geometry:
         return (x * cos + y * sin, y * cos - x * sin)
 
     def normalize_angle(angle):
+        # Works for scalars and arrays alike.
         return (angle + 180) % 360 - 180
 
+    # Array versions of the above. Points and positions are (..., 2) arrays and
+    # rotations (...) arrays, all broadcast against each other, so a single origin or
+    # rotation can be shared by many points and a single point placed at many origins.
+
+    def absolute_positions(points, origins, rotations):
+        points = np.asarray(points, dtype=float)
+        origins = np.asarray(origins, dtype=float)
+        return np.stack(_absolute_position(points[..., 0], points[..., 1], origins[..., 0], origins[..., 1], rotations), axis=-1)
+
+    def relative_positions(points, origins, rotations):
+        points = np.asarray(points, dtype=float)
+        origins = np.asarray(origins, dtype=float)
+        return np.stack(_relative_position(points[..., 0], points[..., 1], origins[..., 0], origins[..., 1], rotations), axis=-1)
+
+    def construct_rects(widths, heights, positions, rotations):
+        # The (..., 4, 2) corners of the rectangles, in the same order as construct_rect.
+        dx = np.asarray(widths, dtype=float) / 2
+        dy = np.asarray(heights, dtype=float) / 2
+        (dx, dy) = np.broadcast_arrays(dx, dy)
+        corners = np.stack((
+            np.stack((dx, -dy), axis=-1),
+            np.stack((dx, dy), axis=-1),
+            np.stack((-dx, dy), axis=-1),
+            np.stack((-dx, -dy), axis=-1)
+        ), axis=-2)
+        return Geometry.absolute_positions(corners, np.asarray(positions, dtype=float)[..., None, :],
+            np.asarray(rotations, dtype=float)[..., None])
+
+    def egocentric_states(states, goals):
+        # The goals (x, y, angle) as seen from the cars (x, y, angle), as in
+        # ParkingSimulator.get_state(egocentric=True): (..., 3) arrays, without rounding.
+        states = np.asarray(states, dtype=float)
+        goals = np.asarray(goals, dtype=float)
+        position = Geometry.relative_positions(goals[..., :2], states[..., :2], states[..., 2])
+        angle = Geometry.normalize_angle(Geometry.normalize_angle(goals[..., 2]) - Geometry.normalize_angle(states[..., 2]))
+        return np.concatenate((position, angle[..., None]), axis=-1)
+
 class Viewport:
     _width = 0
     _height = 0
@@ -67,13 +105,29 @@ class Viewport:
     def transform_width(self, width):
         return width * self._scale
 
+    # World coordinates have y pointing up, screen coordinates down, so the
+    # transforms end with flipping y over the window height.
+
     def transform_point(self, p):
         (x, y) = p
         return (
             (x - self._focusx) * self._scale + self._focusx - self._offsetx,
-            (y - self._focusy) * self._scale + self._focusy - self._offsety
+            self._height - 1 - ((y - self._focusy) * self._scale + self._focusy - self._offsety)
         )
 
+    def transform_points(self, points, position = (0, 0), rotation = 0):
+        # Screen coordinates of (..., 2) points given in a frame placed at the world
+        # position and rotation, as one combined affine transform.
+        (x0, y0) = position
+        sin = math.sin(math.radians(rotation)) * self._scale
+        cos = math.cos(math.radians(rotation)) * self._scale
+        matrix = np.array([[cos, -sin], [-sin, -cos]])
+        offset = (
+            x0 * self._scale + self._focusx * (1 - self._scale) - self._offsetx,
+            self._height - 1 - (y0 * self._scale + self._focusy * (1 - self._scale) - self._offsety)
+        )
+        return np.asarray(points) @ matrix.T + offset
+
     def transform_rect(self, rect):
         trans_rect = [(0, 0), (0, 0), (0, 0), (0, 0)]
         for i in range(4):
@@ -99,6 +153,11 @@ class Car:
     _c = (0, 0)          # circle center
     _r = 0               # circle radius
 
+    _parts = None        # corners of the car parts in the car's frame, see _local_parts
+    _tire = None         # corners of a tire around its center
+    _turned_parts = None # _parts with the front tires turned by _turned_alpha
+    _turned_alpha = None
+
     def __init__(self, x, y, angle):
         self._x = x
         self._y = y
@@ -169,36 +228,58 @@ class Car:
             else:
                 self._theta -= beta
     
+    def advance(self, pedal, dt, frames, steering = 0):
+        # Same as calling turn_wheel(steering, dt) and move(pedal, dt) for the given number
+        # of frames. While the wheel is still turning the frames are stepped one by one,
+        # after that the controls are constant and the rest is computed in closed form.
+        while frames > 0 and _wheel_turning(steering, self._alpha):
+            self.turn_wheel(steering, dt)
+            self.move(pedal, dt)
+            frames -= 1
+        if frames <= 0:
+            return
+
+        # The last frame is stepped as well, so that it sets the turning circle like move does.
+        if frames > 1:
+            (x, y, theta, v, r) = _advance_constant(self._x, self._y, self._theta, self._v, self._alpha,
+                pedal, dt, frames - 1, self._axle_distance, self._acceleration, self._friction)
+            (self._x, self._y, self._theta, self._v, self._r) = (float(x), float(y), float(theta), float(v), float(r))
+        self.move(pedal, dt)
+
+    def _local_parts(self):
+        # The (8, 4, 2) corners of the front and rear axle, the four tires (front left,
+        # front right, rear left, rear right), the body and the cabin in the car's frame.
+        # The parts are built once, only the front tires are turned by the wheel angle
+        # and that again only when the angle changes.
+        if Car._parts is None:
+            (w, l, a) = (self._width, self._length, self._axle_distance)
+            Car._parts = Geometry.construct_rects(
+                (w, w, l / 10, l / 10, l / 10, l / 10, 0.7 * w, 0.5 * w),
+                (l / 20, l / 20, 0.2 * l, 0.2 * l, 0.2 * l, 0.2 * l, l, 0.5 * l),
+                ((0, a / 2), (0, -a / 2), (-w / 2, a / 2), (w / 2, a / 2), (-w / 2, -a / 2), (w / 2, -a / 2), (0, 0), (0, -0.1 * l)),
+                0)
+            Car._tire = Geometry.construct_rects(l / 10, 0.2 * l, (0, 0), 0)
+        if self._alpha == 0:
+            return Car._parts
+        if self._alpha != self._turned_alpha:
+            sin = math.sin(math.radians(self._alpha))
+            cos = math.cos(math.radians(self._alpha))
+            tire = Car._tire @ np.array([[cos, sin], [-sin, cos]])
+            self._turned_parts = Car._parts.copy()
+            self._turned_parts[2] = tire + (-self._width / 2, self._axle_distance / 2)
+            self._turned_parts[3] = tire + (self._width / 2, self._axle_distance / 2)
+            self._turned_alpha = self._alpha
+        return self._turned_parts
+
     def render(self, surface, viewport):
         if self._draw_guides:
             if self._r > 0 and self._r < 1000:
-                (cx, cy) = self._c
-                gfxdraw.circle(surface, round(cx), round(cy), round(self._r), (0, 0, 128))
-
-        body = Geometry.construct_rect(0.7 * self._width, self._length, (self._x, self._y), self._theta)
-        cabin = Geometry.construct_rect(0.5 * self._width, 0.5 * self._length,
-            Geometry.absolute_position((0, -0.1 * self._length), (self._x, self._y), self._theta), self._theta)
-        axle_front = Geometry.construct_rect(self._width, self._length / 20,
-            Geometry.absolute_position((0, 0.5 * self._axle_distance), (self._x, self._y), self._theta), self._theta)
-        axle_rear = Geometry.construct_rect(self._width, self._length / 20,
-            Geometry.absolute_position((0, -0.5 * self._axle_distance), (self._x, self._y), self._theta), self._theta)
-        tire_fl = Geometry.construct_rect(self._length / 10, 0.2 * self._length,
-            Geometry.absolute_position((-self._width / 2, 0.5 * self._axle_distance), (self._x, self._y), self._theta), self._theta + self._alpha)
-        tire_fr = Geometry.construct_rect(self._length / 10, 0.2 * self._length,
-            Geometry.absolute_position((self._width / 2, 0.5 * self._axle_distance), (self._x, self._y), self._theta), self._theta + self._alpha)
-        tire_rl = Geometry.construct_rect(self._length / 10, 0.2 * self._length,
-            Geometry.absolute_position((-self._width / 2, -0.5 * self._axle_distance), (self._x, self._y), self._theta), self._theta)
-        tire_rr = Geometry.construct_rect(self._length / 10, 0.2 * self._length,
-            Geometry.absolute_position((self._width / 2, -0.5 * self._axle_distance), (self._x, self._y), self._theta), self._theta)
-        
-        body = viewport.transform_rect(body)
-        cabin = viewport.transform_rect(cabin)
-        axle_front = viewport.transform_rect(axle_front)
-        axle_rear = viewport.transform_rect(axle_rear)
-        tire_fl = viewport.transform_rect(tire_fl)
-        tire_fr = viewport.transform_rect(tire_fr)
-        tire_rl = viewport.transform_rect(tire_rl)
-        tire_rr = viewport.transform_rect(tire_rr)
+                (cx, cy) = viewport.transform_point(self._c)
+                gfxdraw.circle(surface, round(cx), round(cy), round(viewport.transform_width(self._r)), (0, 0, 128))
+
+        # All parts go from the car's frame to the screen in one transform.
+        parts = viewport.transform_points(self._local_parts(), (self._x, self._y), self._theta).tolist()
+        (axle_front, axle_rear, tire_fl, tire_fr, tire_rl, tire_rr, body, cabin) = parts
 
         pygame.draw.polygon(surface, "gray20", axle_front, 0)
         pygame.draw.polygon(surface, "gray20", axle_rear, 0)
@@ -211,6 +292,167 @@ class Car:
         gfxdraw.aapolygon(surface, cabin, (64, 0, 0))
         gfxdraw.filled_polygon(surface, cabin, (64, 0, 0))
 
+# Struct-of-arrays version of Car that moves N cars at once. Every array
+# element follows exactly the same equations as Car.turn_wheel and Car.move.
+class CarBatch:
+    _axle_distance = Car._axle_distance
+    _acceleration = Car._acceleration
+    _friction = Car._friction
+    _turn_speed = Car._turn_speed
+
+    def __init__(self, x, y, angle, v = 0, alpha = 0):
+        (self._x, self._y, self._theta, self._v, self._alpha) = [
+            a.astype(float) for a in np.broadcast_arrays(x, y, angle, v, alpha)]
+        self._r = np.zeros(self._x.shape)
+
+    def from_cars(cars):
+        return CarBatch(
+            [car._x for car in cars], [car._y for car in cars], [car._theta for car in cars],
+            [car._v for car in cars], [car._alpha for car in cars])
+
+    def __len__(self):
+        return len(self._x)
+
+    def reset(self, mask, x, y, angle):
+        # Place the selected cars at the given poses and stop them.
+        for (name, value) in (("_x", x), ("_y", y), ("_theta", angle)):
+            getattr(self, name)[mask] = np.broadcast_to(value, self._x.shape)[mask]
+        for name in ("_v", "_alpha", "_r"):
+            getattr(self, name)[mask] = 0
+
+    def get_position(self):
+        return np.stack((self._x, self._y), axis=-1)
+
+    def get_orientation(self):
+        return self._theta
+
+    def get_wheel_position(self):
+        return self._alpha
+
+    def get_speed(self):
+        return self._v
+
+    def turn_wheel(self, direction, dt):
+        direction = np.asarray(direction)
+        alpha = np.where(direction > 0, self._alpha + self._turn_speed * dt, self._alpha)
+        alpha = np.where(direction < 0, alpha - self._turn_speed * dt, alpha)
+        self._alpha = np.clip(alpha, -30, 30)
+
+    def move(self, pedal, dt):
+        # Distance travelled
+        self._v = self._v + pedal * self._acceleration * dt
+        self._v = self._v - self._v * self._friction * dt
+        s = self._v * dt
+
+        theta = self._theta
+        alpha = self._alpha
+        straight = alpha == 0
+        left = alpha > 0
+
+        # If wheels are straight
+        (x_straight, y_straight) = _absolute_position(0, s, self._x, self._y, theta)
+
+        # If wheels are turned (the straight cars get a dummy angle to avoid dividing by 0)
+        turned_alpha = np.where(straight, 1.0, alpha)
+        r = self._axle_distance / (2 * np.sin(np.radians(np.abs(turned_alpha))))
+        (t0x, t0y) = _absolute_position(0, self._axle_distance/2, self._x, self._y, theta)
+
+        # Move along the circle arc
+        beta = (180 * s) / (np.pi * r)
+        cos_beta = np.cos(np.radians(beta))
+        sin_beta = np.sin(np.radians(beta))
+        arc_x = np.where(left, r * (cos_beta - 1), r * (1 - cos_beta))
+        (t1x, t1y) = _absolute_position(arc_x, r * sin_beta, t0x, t0y, theta + turned_alpha)
+
+        # New body position
+        angle = np.radians(180 - turned_alpha)
+        (x_turned, y_turned) = _absolute_position(self._axle_distance/2 * np.cos(angle), self._axle_distance/2 * np.sin(angle),
+            t1x, t1y, theta + turned_alpha + 90)
+
+        self._x = np.where(straight, x_straight, x_turned)
+        self._y = np.where(straight, y_straight, y_turned)
+        self._r = np.where(straight, 0, r)
+
+        # New body angle
+        self._theta = np.where(straight, theta, np.where(left, theta + beta, theta - beta))
+
+    def step(self, direction, steering, dt):
+        self.turn_wheel(steering, dt)
+        self.move(direction, dt)
+
+    def advance(self, direction, steering, dt, frames):
+        # Same as Car.advance for all cars: step while any wheel is still turning,
+        # then compute the remaining frames in closed form.
+        while frames > 0 and np.any(_wheel_turning(steering, self._alpha)):
+            self.step(direction, steering, dt)
+            frames -= 1
+        if frames <= 0:
+            return
+
+        (self._x, self._y, self._theta, self._v, self._r) = _advance_constant(
+            self._x, self._y, self._theta, self._v, self._alpha,
+            direction, dt, frames, self._axle_distance, self._acceleration, self._friction)
+
+def _wheel_turning(steering, alpha):
+    steering = np.asarray(steering)
+    return ((steering > 0) & (alpha < 30)) | ((steering < 0) & (alpha > -30))
+
+def _advance_constant(x, y, theta, v, alpha, pedal, dt, frames, axle_distance, acceleration, friction):
+    # Closed form of the given number of Car.move steps with constant pedal and wheel angle.
+    # Every step computes v = (v + c) * q, so the speed is a geometric sequence.
+    q = 1 - friction * dt
+    c = pedal * acceleration * dt
+    if q == 1:
+        v_sum = frames * v + c * frames * (frames + 1) / 2
+        v = v + frames * c
+    else:
+        g = q * (1 - q ** frames) / (1 - q)
+        v_sum = v * g + c * q / (1 - q) * (frames - g)
+        v = q ** frames * v + c * q * (1 - q ** frames) / (1 - q)
+    s = v_sum * dt
+
+    # With straight wheels the car moves along its heading.
+    straight = np.asarray(alpha) == 0
+    x_straight = x - s * np.sin(np.radians(theta))
+    y_straight = y + s * np.cos(np.radians(theta))
+
+    # With turned wheels the arc steps telescope: the body moves by sign * r * (e^(i*phi1) - e^(i*phi0))
+    # where phi = theta + alpha, and phi and theta turn by the total rotational distance.
+    turned_alpha = np.where(straight, 1.0, alpha)
+    sign = np.sign(turned_alpha)
+    r = axle_distance / (2 * np.sin(np.radians(np.abs(turned_alpha))))
+    beta = (180 * s) / (np.pi * r)
+    phi0 = np.radians(theta + turned_alpha)
+    phi1 = np.radians(theta + turned_alpha + sign * beta)
+    x_turned = x + sign * r * (np.cos(phi1) - np.cos(phi0))
+    y_turned = y + sign * r * (np.sin(phi1) - np.sin(phi0))
+
+    return (
+        np.where(straight, x_straight, x_turned),
+        np.where(straight, y_straight, y_turned),
+        np.where(straight, theta, theta + sign * beta),
+        v,
+        np.where(straight, 0, r)
+    )
+
+def _absolute_position(x, y, x0, y0, rotation):
+    sin = np.sin(np.radians(rotation))
+    cos = np.cos(np.radians(rotation))
+    return (x0 + x * cos - y * sin, y0 + x * sin + y * cos)
+
+def _relative_position(x, y, x0, y0, rotation):
+    x = x - x0
+    y = y - y0
+    sin = np.sin(np.radians(rotation))
+    cos = np.cos(np.radians(rotation))
+    return (x * cos + y * sin, y * cos - x * sin)
+
+def _round_state(x, y, a, v, w):
+    # Stack state arrays into rows and zero the small values like ParkingSimulator.get_state.
+    state = np.stack((x, y, a, v, w), axis=-1)
+    state[np.abs(state) < (1, 1, 0.1, 1, 0.1)] = 0
+    return state
+
 class Goal:
     _length = 120
     _width = 80
@@ -251,6 +493,207 @@ class Goal:
             viewport.transform_point((self._x + 10, self._y + 10)),
             round(viewport.transform_width(4)))
 
+# Draws the 84x84 monochrome DQN observations straight into NumPy arrays, pixel
+# for pixel the same as the PIL drawing they replace: the parking place outline
+# and the car rectangle filled by PIL's polygon scanline algorithm (_fill_polygon).
+# The fill of a polygon with integer corners does not change when it is moved by
+# whole pixels, as long as it stays at x >= 0 where PIL's rounding is the same
+# everywhere, so every distinct corner pattern is filled once and kept as a
+# sprite; rendering then only pastes sprites. Cars crossing the left border are
+# filled where they are.
+class DqnRasterizer:
+    _size = 84
+    _sprite_size = 16            # sprites are padded by _sprite_margin around the corners
+    _sprite_margin = 2
+    _corners = (np.array([3.5, 3.5, -3.5, -3.5]), np.array([-2.0, 2.0, 2.0, -2.0]))  # construct_rect(7, 4, (0, 0), 0)
+
+    def __init__(self):
+        # The parking place outline [(38, 40), (45, 40), (45, 44), (38, 44)] never changes.
+        self._background = np.zeros((self._size, self._size), dtype=np.uint8)
+        self._background[40:45, 38:46] = 255
+        self._background[41:44, 39:45] = 0
+        self._buffer = np.empty((self._size, self._size), dtype=np.uint8)
+        self._sprite_index = {}
+        self._sprites = np.zeros((0, self._sprite_size, self._sprite_size), dtype=bool)
+
+    def render(self, x, y, a):
+        # Render one observation into the reused buffer and return it. A car whose
+        # sprite is known is pasted with plain Python arithmetic and one slice
+        # assignment, clipped to the image, all others go through render_batch.
+        center = (round((x + 500) * 84/1000), round((500 - y) * 84/1000))
+        corners = Geometry.construct_rect(7, 4, center, 360 - a)
+        xs = [int(px) for (px, _) in corners]
+        ys = [int(py) for (_, py) in corners]
+        if min(xs) >= 0:
+            (x0, y0) = (min(xs) - self._sprite_margin, min(ys) - self._sprite_margin)
+            code = 0
+            for value in reversed([px - x0 for px in xs] + [py - y0 for py in ys]):
+                code = code * self._sprite_size + value
+            index = self._sprite_index.get(code)
+            if index is not None:
+                (r0, c0) = (max(0, -y0), max(0, -x0))
+                (r1, c1) = (min(self._sprite_size, self._size - y0), min(self._sprite_size, self._size - x0))
+                np.copyto(self._buffer, self._background)
+                if r0 < r1 and c0 < c1:
+                    self._buffer[y0 + r0:y0 + r1, x0 + c0:x0 + c1][self._sprites[index, r0:r1, c0:c1]] = 255
+                return self._buffer
+        self.render_batch(((x, y, a),), self._buffer[None])
+        return self._buffer
+
+    def render_batch(self, states, out = None):
+        # Render the (M, 84, 84) observations of M states (x, y, angle, ...) relative to the goal.
+        states = np.asarray(states, dtype=float)
+        if out is None:
+            out = np.empty((len(states), self._size, self._size), dtype=np.uint8)
+        out[...] = self._background
+
+        # The car's position in pixels and its corners, truncated to whole pixels like PIL does.
+        cx = np.round((states[:, 0] + 500) * 84/1000)
+        cy = np.round((500 - states[:, 1]) * 84/1000)
+        (x, y) = _absolute_position(*self._corners, cx[:, None], cy[:, None], 360 - states[:, 2, None])
+        (x, y) = (np.trunc(x).astype(np.int64), np.trunc(y).astype(np.int64))
+
+        # Paste the sprite of every car's corner pattern at the car's position,
+        # clipping only the cars whose sprites reach over the border.
+        (x0, y0) = (x.min(axis=1) - self._sprite_margin, y.min(axis=1) - self._sprite_margin)
+        (m, row, col) = np.nonzero(self._sprites_of(x - x0[:, None], y - y0[:, None]))
+        (px, py) = (x0[m] + col, y0[m] + row)
+        if min(x0.min(), y0.min()) < 0 or max(x0.max(), y0.max()) > self._size - self._sprite_size:
+            inside = (px >= 0) & (px < self._size) & (py >= 0) & (py < self._size)
+            (m, px, py) = (m[inside], px[inside], py[inside])
+        out[m, py, px] = 255
+
+        # PIL rounds differently at x < 0, so cars over the left border are filled where they are.
+        for m in np.flatnonzero(x0 < -self._sprite_margin):
+            mask = np.zeros((self._size, self._size), dtype=bool)
+            _fill_polygon(mask, list(zip(x[m].tolist(), y[m].tolist())))
+            out[m] = np.where(mask, 255, self._background)
+        return out
+
+    def _sprites_of(self, x, y):
+        # The (M, S, S) sprites of cars with the given (M, 4) corners relative to the sprite origin.
+        codes = np.concatenate((x, y), axis=1) @ (self._sprite_size ** np.arange(8, dtype=np.int64))
+        if len(codes) > 64:
+            (codes, first, inverse) = np.unique(codes, return_index=True, return_inverse=True)
+        else:
+            (first, inverse) = (range(len(codes)), slice(None))
+        index = []
+        for (code, i) in zip(codes.tolist(), first):
+            if code not in self._sprite_index:
+                sprite = np.zeros((1, self._sprite_size, self._sprite_size), dtype=bool)
+                _fill_polygon(sprite[0], list(zip(x[i].tolist(), y[i].tolist())))
+                self._sprite_index[code] = len(self._sprites)
+                self._sprites = np.concatenate((self._sprites, sprite))
+            index.append(self._sprite_index[code])
+        return self._sprites[np.asarray(index)[inverse]]
+
+def _round_half_up(f):
+    # PIL's ROUND_UP and ROUND_DOWN of a float32 value, symmetric around 0.
+    half = np.float32(0.5)
+    return int(math.floor(f + half)) if f >= 0 else -int(math.floor(abs(f) + half))
+
+def _round_half_down(f):
+    half = np.float32(0.5)
+    return int(math.ceil(f - half)) if f >= 0 else -int(math.ceil(abs(f) - half))
+
+def _roundf(f):
+    return np.float32(math.copysign(math.floor(abs(f) + 0.5), f))
+
+def _fill_polygon(mask, points):
+    # Set the pixels of the boolean mask that ImageDraw.polygon fills for the given
+    # integer corners: a port of polygon_generic in Pillow's Draw.c, including its
+    # float32 arithmetic and the rules it uses to connect corners.
+    (height, width) = mask.shape
+
+    def hline(x0, y, x1):
+        if 0 <= y < height:
+            (x0, x1) = (max(x0, 0), min(x1, width - 1))
+            if x0 <= x1:
+                mask[y, x0:x1 + 1] = True
+
+    # Build the edges (x0, y0, xmin, ymin, xmax, ymax, dx), merging consecutive
+    # horizontal edges that run in the same direction.
+    edges = []
+    count = len(points)
+    for i in range(count - 1):
+        ((x0, y0), (x1, y1)) = (points[i], points[i + 1])
+        if y0 == y1 and i != 0 and y0 == points[i - 1][1]:
+            last = edges[-1]
+            if x1 > x0 > points[i - 1][0]:
+                last[4] = x1
+                continue
+            elif x1 < x0 < points[i - 1][0]:
+                last[2] = x1
+                continue
+        edges.append(_polygon_edge(x0, y0, x1, y1))
+    if points[-1] != points[0]:
+        edges.append(_polygon_edge(*points[-1], *points[0]))
+
+    ymin = min(edge[3] for edge in edges)
+    ymax = max(edge[5] for edge in edges)
+    table = []
+    for edge in edges:
+        if edge[3] == edge[5]:
+            hline(edge[2], edge[3], edge[4])
+        else:
+            table.append(edge)
+    ymin = max(ymin, 0)
+    ymax = min(ymax, height)
+
+    for y in range(ymin, ymax + 1):
+        xx = []
+        for (i, current) in enumerate(table):
+            (x0, y0, _, cymin, _, cymax, dx) = current
+            if not cymin <= y <= cymax:
+                continue
+            xx.append(np.float32(y - y0) * dx + np.float32(x0))
+            if y == cymax and y < ymax:
+                xx.append(xx[-1])
+            elif (y == cymin or y == cymax) and dx != 0:
+                for other in table[:i]:
+                    (ox0, oy0, _, oymin, _, oymax, odx) = other
+                    if (y != oymin and y != oymax) or odx == 0:
+                        continue
+                    if _roundf(xx[-1]) == _roundf(np.float32(y - oy0) * odx + np.float32(ox0)):
+                        offset = -1 if y == cymax else 1
+                        adjacent = np.float32(y + offset - y0) * dx + np.float32(x0)
+                        if oymin <= y + offset <= oymax:
+                            adjacent_other = np.float32(y + offset - oy0) * odx + np.float32(ox0)
+                            if xx[-1] > adjacent + np.float32(1) and xx[-1] > adjacent_other + np.float32(1):
+                                xx[-1] = _roundf(max(adjacent, adjacent_other)) + np.float32(1)
+                            elif xx[-1] < adjacent - np.float32(1) and xx[-1] < adjacent_other - np.float32(1):
+                                xx[-1] = _roundf(min(adjacent, adjacent_other)) - np.float32(1)
+                            break
+        xx.sort()
+        for i in range(1, len(xx), 2):
+            hline(_round_half_up(xx[i - 1]), y, _round_half_down(xx[i]))
+
+def _polygon_edge(x0, y0, x1, y1):
+    dx = np.float32(0) if y0 == y1 else np.float32(x1 - x0) / np.float32(y1 - y0)
+    return [x0, y0, min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1), dx]
+
+# Fixed-capacity history of the last k frames. Every frame is written twice,
+# k slots apart, so the last k frames are always one contiguous slice of the
+# buffer and can be returned as a view (oldest first) without copying.
+class FrameStack:
+    def __init__(self, k, shape = (84, 84), dtype = np.uint8):
+        self._k = k
+        self._frames = np.zeros((2 * k,) + shape, dtype=dtype)
+        self._pos = 0
+
+    def clear(self):
+        self._frames[...] = 0
+        self._pos = 0
+
+    def push(self, frame):
+        self._frames[self._pos] = frame
+        self._frames[self._pos + self._k] = frame
+        self._pos = (self._pos + 1) % self._k
+
+    def get(self):
+        # The view changes with the next push; copy it to keep the frames.
+        return self._frames[self._pos:self._pos + self._k]
+
 class ParkingSimulator:
     _surface = None
     _font = None
@@ -274,11 +717,14 @@ class ParkingSimulator:
 
     _output_text = ["" for i in range(10)]
     _dqn_image = None
+    _dqn_rasterizer = None
+    _dqn_history = None
+    _recorder = None
 
     def __init__(self,
         initial_state, goal_state, goal_tolerance = (0, 0, 0),
         visualize = True, fps = 60, window_size = (1280, 720),
-        use_dqn_image = False
+        use_dqn_image = False, dqn_history = 4
     ):        
         if visualize and fps > 0:
             global pygame
@@ -298,11 +744,8 @@ class ParkingSimulator:
             self._visualize = False
         
         if use_dqn_image:
-            global Image
-            global ImageDraw
-            global np
-            from PIL import Image, ImageDraw
-            import numpy as np
+            self._dqn_rasterizer = DqnRasterizer()
+            self._dqn_history = FrameStack(dqn_history)
         self._use_dqn_image = use_dqn_image
 
         self._fps = fps
@@ -331,6 +774,7 @@ class ParkingSimulator:
         self._was_reset = True
 
         if self._use_dqn_image:
+            self._dqn_history.clear()
             self._render_dqn_image()
 
     def was_reset(self):
@@ -341,7 +785,22 @@ class ParkingSimulator:
     def stop(self):
         self._run = False
 
+    def attach_recorder(self, recorder):
+        # Record a transition for every call of run() or run_headless(); None detaches.
+        self._recorder = recorder
+
+    def _record(self, state):
+        self._recorder.append(state, (self._input_direction, self._input_steering), self.get_state(),
+            self.goal_reached(), self._dqn_image)
+
     def run(self, frames = 1, render_all_frames = True):
+        # Nothing to render or read from the keyboard, so only the physics is left.
+        if not self._visualize and not self._use_dqn_image:
+            return self.run_headless(frames)
+
+        if self._recorder is not None:
+            state = self.get_state()
+
         for _ in range(frames):
             self._car.turn_wheel(self._input_steering, self._dt)
             self._car.move(self._input_direction, self._dt)
@@ -355,6 +814,27 @@ class ParkingSimulator:
             self._render_dqn_image()
             self.render_frame()
 
+        if self._recorder is not None:
+            self._record(state)
+        return self._run
+
+    def run_headless(self, frames = 1):
+        # Advance the physics by the given number of frames without processing
+        # input or rendering anything. The DQN image is only updated for a
+        # recorder that records images, once after the last frame.
+        if self._recorder is not None:
+            state = self.get_state()
+
+        car = self._car
+        (steering, direction, dt) = (self._input_steering, self._input_direction, self._dt)
+        for _ in range(frames):
+            car.turn_wheel(steering, dt)
+            car.move(direction, dt)
+
+        if self._recorder is not None:
+            if self._recorder.records_images():
+                self._render_dqn_image()
+            self._record(state)
         return self._run
 
     def get_state(self, egocentric = False):
@@ -418,11 +898,21 @@ class ParkingSimulator:
             self._output_text[line] = text
 
     def get_dqn_image(self):
-        if self._dqn_image != None:
-            return np.array(self._dqn_image) / 255
+        if self._dqn_image is not None:
+            return self._dqn_image / 255
         else:
             return None
 
+    def get_dqn_stack(self, as_float = False):
+        # The last dqn_history DQN images (oldest first) as a (k, 84, 84) uint8 view,
+        # frames before the last reset are zeros. With as_float a scaled copy is returned.
+        if self._dqn_history is None:
+            return None
+        frames = self._dqn_history.get()
+        if as_float:
+            return frames / 255
+        return frames
+
     def _process_input(self):
         if not self._visualize:
             return
@@ -496,12 +986,11 @@ class ParkingSimulator:
         self._surface.fill("gray")
         self._goal.render(self._surface, self._viewport, self.goal_reached())
         self._car.render(self._surface, self._viewport)
-        self._surface.blit(pygame.transform.flip(self._surface, False, True), dest = (0, 0))
         self._print_info()
 
-        if self._dqn_image != None:
-            img = self._dqn_image.convert("RGB")
-            surface = pygame.image.fromstring(img.tobytes(), img.size, "RGB")
+        if self._dqn_image is not None:
+            img = np.repeat(self._dqn_image[:, :, None], 3, axis=2)
+            surface = pygame.image.fromstring(img.tobytes(), (84, 84), "RGB")
             self._surface.blit(surface, dest = (self._surface.get_width() - 100, 16))
 
         pygame.display.flip()
@@ -511,17 +1000,118 @@ class ParkingSimulator:
         if not self._use_dqn_image:
             return
 
-        self._dqn_image = Image.new("L", (84, 84), 0)
-        draw = ImageDraw.Draw(self._dqn_image)
+        # Draw the parking place and the car into the reused image buffer.
+        (x, y, a, _, _) = self.get_state()
+        self._dqn_image = self._dqn_rasterizer.render(x, y, a)
+        self._dqn_history.push(self._dqn_image)
 
-        # Draw the parking place.
-        draw.polygon([(38, 40), (45, 40), (45, 44), (38, 44)], outline=255, fill=0)
+# M independent parking episodes simulated in lockstep without visualization.
+# States and actions are arrays with one row per episode, and episodes that
+# reach their goal (or run out of frames) are reset automatically.
+class VectorParkingSimulator:
+    _fps = 0
+    _dt = 0
+    _cars = None
+    _initial_state = None
+    _goal_state = None
+    _goal_tolerance = None
+    _max_frames = None
+    _frames = None
+    _input_direction = None
+    _input_steering = None
+    _was_reset = None
+    _final_state = None
+    _dqn_rasterizer = None
 
-        # Compute the car's position.
-        (x, y, a, _, _) = self.get_state()
-        x = round((x + 500) * 84/1000)
-        y = round((500 - y) * 84/1000)
+    def __init__(self,
+        n_episodes, initial_state, goal_state, goal_tolerance = (0, 0, 0),
+        fps = 60, max_frames = None
+    ):
+        # Per-episode (M, 3) arrays; a single tuple is shared by all episodes.
+        shape = (n_episodes, 3)
+        self._initial_state = np.broadcast_to(np.asarray(initial_state, dtype=float), shape).copy()
+        self._goal_state = np.broadcast_to(np.asarray(goal_state, dtype=float), shape).copy()
+        self._goal_tolerance = np.broadcast_to(np.asarray(goal_tolerance, dtype=float), shape).copy()
+        self._max_frames = max_frames
 
-        # Draw the car.
-        rect = Geometry.construct_rect(7, 4, (x, y), 360 - a)
-        draw.polygon(rect, outline=255, fill=255)
\ No newline at end of file
+        self._fps = fps
+        self._dt = 1.0 / fps
+
+        (x0, y0, angle0) = self._initial_state.T
+        self._cars = CarBatch(x0, y0, angle0)
+        self._frames = np.zeros(n_episodes, dtype=int)
+        self._input_direction = np.zeros(n_episodes)
+        self._input_steering = np.zeros(n_episodes)
+        self._was_reset = np.zeros(n_episodes, dtype=bool)
+        self._final_state = np.zeros((n_episodes, 5))
+
+    def __len__(self):
+        return len(self._cars)
+
+    def reset(self, mask = None):
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        (x0, y0, angle0) = self._initial_state.T
+        self._cars.reset(mask, x0, y0, angle0)
+        self._frames[mask] = 0
+        self._was_reset |= mask
+
+    def was_reset(self):
+        ret = self._was_reset
+        self._was_reset = np.zeros(len(self), dtype=bool)
+        return ret
+
+    def run(self, frames = 1):
+        # Returns the mask of episodes that finished and were reset. Their last
+        # states before the reset are available from get_final_state().
+        done = np.zeros(len(self), dtype=bool)
+        for _ in range(frames):
+            self._cars.turn_wheel(self._input_steering, self._dt)
+            self._cars.move(self._input_direction, self._dt)
+            self._frames += 1
+
+            finished = self.goal_reached()
+            if self._max_frames is not None:
+                finished |= self._frames >= self._max_frames
+            if finished.any():
+                self._final_state[finished] = self.get_state()[finished]
+                self.reset(finished)
+                done |= finished
+        return done
+
+    def get_final_state(self):
+        return self._final_state
+
+    def get_dqn_images(self, out = None):
+        # The (M, 84, 84) uint8 DQN observations of all episodes.
+        if self._dqn_rasterizer is None:
+            self._dqn_rasterizer = DqnRasterizer()
+        return self._dqn_rasterizer.render_batch(self.get_state(), out)
+
+    def get_state(self, egocentric = False):
+        (x, y) = self._cars.get_position().T
+        angle_car = self._cars.get_orientation()
+        v = self._cars.get_speed()
+        w = self._cars.get_wheel_position()
+        (x0, y0, angle_goal) = self._goal_state.T
+        if egocentric:
+            (x, y, a) = Geometry.egocentric_states(np.stack((x, y, angle_car), axis=-1), self._goal_state).T
+        else:
+            (x, y) = (x - x0, y - y0)
+            a = Geometry.normalize_angle(Geometry.normalize_angle(angle_car) - Geometry.normalize_angle(angle_goal))
+
+        return _round_state(x, y, a, v, w)
+
+    def goal_reached(self):
+        state = self.get_state()
+        return np.all(np.abs(state[:, :3]) < self._goal_tolerance, axis=1)
+
+    def execute_action(self, actions):
+        actions = np.asarray(actions)
+        if actions.ndim == 1:
+            # Discrete actions are indices into ParkingSimulator.list_actions().
+            (direction, steering) = np.array(ParkingSimulator.list_actions())[actions].T
+        else:
+            (direction, steering) = np.clip(actions, -1, 1).T
+        self._input_direction = direction.astype(float)
+        self._input_steering = steering.astype(float)
\ No newline at end of file
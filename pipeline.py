@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import dataset
+import pade
+
+
+# The qualitative-model chain: samples -> pade -> Q-labels -> decision tree -> plot.
+# Every stage is cached on disk under a key that hashes its parameters together
+# with the key of the stage it depends on, so a stage only reruns when something
+# it depends on changes. The samples come either from a dataset (imported from
+# CSV when it changes) or from a simulation run with the sampling module. Only
+# simulated samples are cached, a dataset is already on disk.
+class QualitativePipeline:
+    def __init__(self,
+        features, target, label_attributes, tree_features = None,
+        dataset_path = None, csv_path = None, columns = None, simulation = None,
+        nNeighbours = 10, min_impurity_decrease = 0.02, cache_dir = '.pipeline_cache'
+    ):
+        if (dataset_path is None) == (simulation is None):
+            raise ValueError('give either dataset_path or simulation')
+        self.features = list(features)
+        self.target = target
+        self.label_attributes = list(label_attributes)
+        self.tree_features = list(features if tree_features is None else tree_features)
+        self.dataset_path = dataset_path
+        self.csv_path = csv_path
+        self.columns = columns
+        self.simulation = simulation
+        self.nNeighbours = nNeighbours
+        self.min_impurity_decrease = min_impurity_decrease
+        self.cache_dir = cache_dir
+
+    # Stage keys, computed from the parameters alone so that a cached stage never
+    # needs the outputs of the stages before it.
+
+    def _key(self, stage, parent, params):
+        text = json.dumps({'stage': stage, 'parent': parent, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def samples_key(self):
+        if self.simulation is not None:
+            return self._key('simulate', None, self.simulation)
+        # A dataset is identified by the modification times of its files, after
+        # importing the CSV file if it changed.
+        self._dataset()
+        files = sorted((name, os.path.getmtime(os.path.join(self.dataset_path, name)))
+                       for name in os.listdir(self.dataset_path))
+        return self._key('dataset', None, {'path': self.dataset_path, 'files': files})
+
+    def q_table_key(self):
+        return self._key('pade', self.samples_key(),
+                         {'features': self.features, 'target': self.target, 'nNeighbours': self.nNeighbours})
+
+    def classes_key(self):
+        return self._key('labels', self.q_table_key(), {'attributes': self.label_attributes})
+
+    def model_key(self):
+        return self._key('tree', self.classes_key(),
+                         {'features': self.tree_features, 'min_impurity_decrease': self.min_impurity_decrease})
+
+    def _cached(self, stage, key, compute):
+        path = os.path.join(self.cache_dir, '{}-{}.pkl'.format(stage, key[:16]))
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        value = compute()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(value, f)
+        os.replace(path + '.tmp', path)
+        return value
+
+    # Stages.
+
+    def samples(self):
+        # The samples as (data, column names).
+        if self.simulation is None:
+            samples = self._dataset()
+            return np.array(samples.to_array()), samples.columns()
+        return self._cached('samples', self.samples_key(), self._simulate)
+
+    def _simulate(self):
+        import sampling
+        params = dict(self.simulation)
+        n = params.pop('n')
+        ranges = {name: params.pop(name) for name in ('theta', 'alpha', 'v') if name in params}
+        data = sampling.collect_samples(sampling.UniformControls(n, **ranges), **params)
+        return data, list(sampling.COLUMNS)
+
+    def _dataset(self):
+        if self.csv_path is not None:
+            return dataset.load_or_import(self.dataset_path, self.csv_path, self.columns or dataset.CAR_SAMPLES_COLUMNS)
+        return dataset.load_dataset(self.dataset_path)
+
+    def _select(self, names):
+        if self.simulation is None:
+            return np.array(self._dataset().select(names))
+        (data, columns) = self.samples()
+        return data[:, [columns.index(name) for name in names]]
+
+    def q_table(self):
+        return self._cached('pade', self.q_table_key(), lambda: pade.pade(
+            self._select(self.features), self._select([self.target])[:, 0], nNeighbours=self.nNeighbours))
+
+    def classes(self):
+        # The enumerated Q-label classes as (classes, class_names).
+        def compute():
+            q_table = self.q_table()
+            selected = [self.features.index(name) for name in self.label_attributes]
+            return pade.enumerate_q_table(q_table[:, selected], self.label_attributes)
+        return self._cached('labels', self.classes_key(), compute)
+
+    def model(self):
+        def compute():
+            from sklearn import tree
+            (classes, _) = self.classes()
+            classifier = tree.DecisionTreeClassifier(min_impurity_decrease=self.min_impurity_decrease)
+            return classifier.fit(self._select(self.tree_features), classes)
+        return self._cached('tree', self.model_key(), compute)
+
+    def plot(self):
+        # Plotting is never cached, it only reuses the fitted model.
+        import matplotlib.pyplot as plt
+        from sklearn import tree
+        (_, class_names) = self.classes()
+        tree.plot_tree(self.model(), feature_names=self.tree_features, class_names=class_names, filled=True)
+        plt.show()
@@ -0,0 +1,103 @@
+import json
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# Recorded fields: (shape of one step, dtype).
+FIELDS = {
+    'state': ((5,), np.float64),
+    'action': ((2,), np.float32),
+    'next_state': ((5,), np.float64),
+    'goal': ((), np.bool_),
+}
+IMAGE_FIELD = ('image', ((84, 84), np.uint8))
+
+
+# Records simulator transitions (state, action, next_state, goal flag and optionally
+# the DQN image) into memory-mapped .npy files in a directory. The storage grows in
+# chunks of chunk_size steps, each chunk a separate file, so nothing is ever copied
+# or kept in RAM apart from the pages the operating system caches.
+class TrajectoryRecorder:
+    _directory = None
+    _chunk_size = 0
+    _fields = None
+    _chunks = None
+    _length = 0
+
+    def __init__(self, directory, chunk_size = 65536, record_images = False):
+        self._directory = directory
+        self._chunk_size = chunk_size
+        self._fields = dict(FIELDS)
+        if record_images:
+            (name, spec) = IMAGE_FIELD
+            self._fields[name] = spec
+        self._chunks = []
+        self._length = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def load(directory):
+        # Reopen the chunks of an existing recording to sample from or append to it.
+        with open(os.path.join(directory, 'recorder.json')) as f:
+            meta = json.load(f)
+        recorder = TrajectoryRecorder(directory, meta['chunk_size'], meta['record_images'])
+        recorder._length = meta['length']
+        for chunk in range(-(-recorder._length // recorder._chunk_size)):
+            recorder._chunks.append({name: open_memmap(recorder._chunk_path(name, chunk), mode='r+')
+                                     for name in recorder._fields})
+        return recorder
+
+    def __len__(self):
+        return self._length
+
+    def records_images(self):
+        return IMAGE_FIELD[0] in self._fields
+
+    def _chunk_path(self, name, chunk):
+        return os.path.join(self._directory, '{}_{:05d}.npy'.format(name, chunk))
+
+    def _add_chunk(self):
+        chunk = len(self._chunks)
+        self._chunks.append({
+            name: open_memmap(self._chunk_path(name, chunk), mode='w+', dtype=dtype, shape=(self._chunk_size,) + shape)
+            for (name, (shape, dtype)) in self._fields.items()
+        })
+
+    def append(self, state, action, next_state, goal, image = None):
+        (chunk, row) = divmod(self._length, self._chunk_size)
+        if chunk == len(self._chunks):
+            self._add_chunk()
+        arrays = self._chunks[chunk]
+        arrays['state'][row] = state
+        arrays['action'][row] = action
+        arrays['next_state'][row] = next_state
+        arrays['goal'][row] = goal
+        if image is not None and 'image' in arrays:
+            arrays['image'][row] = image
+        self._length += 1
+
+    def get(self, indices):
+        # Gather the given steps into in-memory arrays, reading only the rows needed.
+        indices = np.asarray(indices, dtype=np.int64)
+        (chunks, rows) = np.divmod(indices, self._chunk_size)
+        batch = {name: np.empty(indices.shape + shape, dtype=dtype) for (name, (shape, dtype)) in self._fields.items()}
+        for chunk in np.unique(chunks):
+            mask = chunks == chunk
+            for (name, array) in self._chunks[chunk].items():
+                batch[name][mask] = array[rows[mask]]
+        return batch
+
+    def sample(self, batch_size, rng = None):
+        # A random minibatch of recorded steps, drawn with replacement.
+        if self._length == 0:
+            raise ValueError('cannot sample from {}, nothing has been recorded'.format(self._directory))
+        if rng is None:
+            rng = np.random.default_rng()
+        return self.get(rng.integers(0, self._length, batch_size))
+
+    def flush(self):
+        for arrays in self._chunks:
+            for array in arrays.values():
+                array.flush()
+        with open(os.path.join(self._directory, 'recorder.json'), 'w') as f:
+            json.dump({'length': self._length, 'chunk_size': self._chunk_size,
+                       'record_images': self.records_images()}, f)
@@ -0,0 +1,95 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from parking_simulator import CarBatch, Geometry, _round_state
+
+# Columns of the collected samples.
+COLUMNS = ['theta', 'alpha', 'gamma', 'v', 'dx', 'dy', 'dtheta']
+
+
+# Full grid over the given theta, alpha and v values as an (n, 3) array of controls.
+def grid_controls(thetas, alphas, vs):
+    (theta, alpha, v) = np.meshgrid(thetas, alphas, vs, indexing='ij')
+    return np.stack((theta.ravel(), alpha.ravel(), v.ravel()), axis=-1).astype(float)
+
+
+# Uniform random distribution of n controls over the given (low, high) ranges.
+class UniformControls:
+    def __init__(self, n, theta=(-180, 180), alpha=(-30, 30), v=(50, 50)):
+        self.n = n
+        self.ranges = (theta, alpha, v)
+
+    def __len__(self):
+        return self.n
+
+    def draw(self, count, rng):
+        return np.stack([rng.uniform(low, high, count) for (low, high) in self.ranges], axis=-1)
+
+
+# Wrap an angle difference to [-180, 180] the same way the explore scripts do.
+def _wrap(angle):
+    angle = np.where(angle > 180, angle - 360, angle)
+    return np.where(angle < -180, angle + 360, angle)
+
+
+# Drive all cars of a chunk from the origin with fixed wheels and initial speed, no pedal.
+# With closed_form the frames are not stepped but computed at once by CarBatch.advance,
+# which agrees with stepping up to floating-point rounding.
+def simulate_controls(controls, frames=50, fps=50, closed_form=False):
+    (theta, alpha, v) = np.asarray(controls, dtype=float).T
+    cars = CarBatch(0, 0, theta, v, alpha)
+    dt = 1.0 / fps
+    if closed_form:
+        cars.advance(0, 0, dt, frames)
+    else:
+        for _ in range(frames):
+            cars.turn_wheel(0, dt)
+            cars.move(0, dt)
+
+    # The final state relative to a goal at (0, 0, 0), as ParkingSimulator.get_state returns it.
+    (x, y) = cars.get_position().T
+    a = Geometry.normalize_angle(Geometry.normalize_angle(cars.get_orientation()) - Geometry.normalize_angle(0))
+    (dx, dy, a, _, _) = _round_state(x, y, a, cars.get_speed(), cars.get_wheel_position()).T
+
+    gamma = _wrap(theta + alpha)
+    dtheta = _wrap(a - theta)
+    return np.stack((theta, alpha, gamma, v, dx, dy, dtheta), axis=-1)
+
+
+def _sample_chunk(source, count, seed, frames, fps, closed_form):
+    if isinstance(source, UniformControls):
+        controls = source.draw(count, np.random.default_rng(seed))
+    else:
+        controls = source
+    return simulate_controls(controls, frames, fps, closed_form)
+
+
+# Stream the samples chunk by chunk, in order. The source is either an (n, 3)
+# array of (theta, alpha, v) controls or UniformControls, in which case every
+# chunk draws its controls from its own seed, so the samples only depend on
+# seed and chunk_size, not on the number of workers.
+def iter_samples(source, frames=50, fps=50, n_jobs=1, chunk_size=10000, seed=0, closed_form=False):
+    if not isinstance(source, UniformControls):
+        source = np.asarray(source, dtype=float)
+    n = len(source)
+    starts = range(0, n, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    tasks = []
+    for (start, chunk_seed) in zip(starts, seeds):
+        stop = min(start + chunk_size, n)
+        chunk = source if isinstance(source, UniformControls) else source[start:stop]
+        tasks.append((chunk, stop - start, chunk_seed, frames, fps, closed_form))
+
+    if n_jobs == 1:
+        for task in tasks:
+            yield _sample_chunk(*task)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            yield from executor.map(_sample_chunk, *zip(*tasks))
+
+
+# Collect all samples into one array with the columns in COLUMNS.
+def collect_samples(source, frames=50, fps=50, n_jobs=1, chunk_size=10000, seed=0, closed_form=False):
+    chunks = list(iter_samples(source, frames, fps, n_jobs, chunk_size, seed, closed_form))
+    if not chunks:
+        return np.zeros((0, len(COLUMNS)))
+    return np.concatenate(chunks)
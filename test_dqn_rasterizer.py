@@ -0,0 +1,57 @@
+import time
+import numpy as np
+import pytest
+from parking_simulator import DqnRasterizer, Geometry
+
+pytest.importorskip('PIL')
+from PIL import Image, ImageDraw
+
+
+# The DQN observation as ParkingSimulator drew it with PIL.
+def pil_observation(x, y, a):
+    image = Image.new('L', (84, 84), 0)
+    draw = ImageDraw.Draw(image)
+    draw.polygon([(38, 40), (45, 40), (45, 44), (38, 44)], outline=255, fill=0)
+    center = (round((x + 500) * 84 / 1000), round((500 - y) * 84 / 1000))
+    draw.polygon(Geometry.construct_rect(7, 4, center, 360 - a), outline=255, fill=255)
+    return np.array(image)
+
+
+# Random states over and past the image borders, some at the angles where edges are
+# horizontal, vertical or diagonal.
+def random_states(n, seed=0):
+    rng = np.random.default_rng(seed)
+    states = np.column_stack((rng.uniform(-560, 560, (n, 2)), rng.uniform(-360, 360, n)))
+    states[:n // 5, 2] = rng.choice([0, 30, 45, 60, 90, 135, 180, -45, -90], n // 5)
+    return states
+
+
+def test_render_batch_matches_pil():
+    states = random_states(5000)
+    expected = np.stack([pil_observation(*state) for state in states])
+    np.testing.assert_array_equal(DqnRasterizer().render_batch(states), expected)
+
+
+def test_render_matches_pil():
+    rasterizer = DqnRasterizer()
+    for state in random_states(1000, seed=1):
+        np.testing.assert_array_equal(rasterizer.render(*state), pil_observation(*state))
+
+
+# Best time of a few runs of function over the states.
+def best_time(function, states, repeat=5):
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for state in states:
+            function(*state)
+        seconds = min(seconds, time.perf_counter() - start)
+    return seconds
+
+
+def test_render_is_faster_than_pil():
+    # Single frames, as ParkingSimulator renders them, once the sprites are known.
+    rasterizer = DqnRasterizer()
+    states = random_states(2000, seed=2) * (0.8, 0.8, 1)
+    rasterizer.render_batch(states)
+    assert best_time(rasterizer.render, states) < best_time(pil_observation, states)